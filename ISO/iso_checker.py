@@ -65,10 +65,10 @@ def check_dvd(folder):
 			corrupt_files += check_dvd(full_path)
 		elif (os.path.isfile(full_path)):
 			### print size and MD5 of ISO
-			size	= file_size(full_path)
-			type	= file_type(full_path)
+			size	= helpers.file_size(full_path)
+			type	= helpers.file_type(full_path)
 			if create_checksums:
-				md5	= file_md5(full_path)
+				md5	= helpers.file_md5(full_path)
 			else:
 				md5	= ''
 
@@ -97,9 +97,9 @@ def check_dir(work_dir):
 					### print size and MD5 of ISO
 					num_iso = num_iso + 1;
 	
-					size	= file_size(full_path)
+					size	= helpers.file_size(full_path)
 					if create_checksums:
-						md5	= file_md5(full_path)
+						md5	= helpers.file_md5(full_path)
 					else:
 						md5	= ''
 
@@ -117,6 +117,8 @@ def print_usage_and_quit():
 	print("arguments:")
 	print(" -f  Scan ISO content")
 	print(" -m  Create MD5 checksums")
+	print(" --no-cache      Do not use the hash cache")
+	print(" --verify-cache  Re-hash all files and verify the hash cache")
 	sys.exit(0)
 
 if __name__ == '__main__':
@@ -129,6 +131,10 @@ if __name__ == '__main__':
 			scan_iso_content = True
 		if arg == '-m':
 			create_checksums = True
+		if arg == '--no-cache':
+			helpers.set_hash_cache_mode('off')
+		if arg == '--verify-cache':
+			helpers.set_hash_cache_mode('verify')
 	
 	if not os.path.exists(mount_point):
 		print("Mount point {} does not exist".format(mount_point))
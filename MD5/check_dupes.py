@@ -1,7 +1,29 @@
 #! /usr/bin/python3
 
+# Find duplicate files, either in a file containing hashes and filenames (as generated
+# by md5sum or MD5Summer, or an MD5 index built by index_md5.py), or directly in one
+# or more directory trees.
+#
+# In directory mode, files are compared in stages to avoid hashing whole trees:
+#   1. Group files by size, files with a unique size can't have duplicates.
+#   2. Group remaining files by a hash of their first and last few KiB.
+#   3. Calculate the MD5 hash of the files still colliding.
+#
+# With option --subtrees, whole duplicate folders are reported instead of single files.
+# A hash is calculated for every folder in the list from the sorted names and hashes of
+# its files and sub-folders (a Merkle tree), so folders with identical content get the
+# same hash, no matter what they are called themselves. Duplicate folders are listed
+# largest first, followed by the duplicate files. Folders and files whose duplicates
+# are all explained by one group of duplicate parent folders, each of them containing
+# exactly one of the duplicates, are not listed again.
+# The list is processed in a single pass, keeping only the folders of the current path
+# open, so the entries of each folder must be grouped together (e.g. sorted by file
+# name with tool_md5.py).
+
 import sys,re,os.path, chardet
 import collections
+import argparse
+import hashlib
 
 # custom modules
 import pathlib
@@ -9,22 +31,12 @@ mod_path = pathlib.Path(__file__).resolve().parents[1]/'helpers'
 sys.path.insert(0, str(mod_path))
 import helpers
 
-def check_dupes(in_fname):
-    tot_num_files = 0
+def report_dupes(result, tot_num_files):
     num_dupes = 0
-    result = collections.defaultdict(list)
-
-    data = helpers.open_and_decode_file(in_fname)
-
-    for line in data.splitlines():
-        item = helpers.split_hash_filename(line)
-        if item:
-            result[item['hash']].append(item['file'])
 
     # Iterate over array and dump dupes
     for hash in result:
         num_files = len(result[hash])
-        tot_num_files += num_files
         if num_files > 1:
             num_dupes += 1
             print('Duplicates with MD5 {}:'.format(hash))
@@ -34,9 +46,164 @@ def check_dupes(in_fname):
     print('{} files scanned'.format(tot_num_files))
     print('{} hashes found with duplicates'.format(num_dupes))
 
+def check_dupes(in_fname):
+    table = helpers.open_checksums(in_fname)
+    order = table.sorted_indices()
+
+    # Report duplicates in the order of their first appearance in the list
+    # (for an MD5 index, in the order of the hashes)
+    groups = sorted((order[start], start, end) for _, (start, end) in table.iter_groups(order) if end - start > 1)
+    result = {table.hash(first) : [table.file(i) for i in order[start:end]] for first, start, end in groups}
+
+    report_dupes(result, len(table))
+
+class _Folder():
+    '''Open folder while building the Merkle tree.'''
+
+    def __init__(self, path):
+        self.path = path
+        self.children = []
+        self.num_files = 0
+
+    def digest(self):
+        h = hashlib.md5()
+        for name, kind, digest in sorted(self.children):
+            h.update(name.encode('utf-8', 'surrogatepass') + b'\0' + kind + digest)
+        return h.digest()
+
+def parent_folder(path):
+    '''Return folder of path in a hash list, '' for the top level.'''
+    i = max(path.rfind('/'), path.rfind('\\'))
+    return path[:i] if i >= 0 else ''
+
+def check_dupes_subtrees(in_fname):
+    tot_num_files = 0
+    folders = {}    # folder path -> (digest, number of files)
+    files = collections.defaultdict(list)   # digest -> files
+    stack = [_Folder('')]
+    names = []      # names of the open folders below the root
+
+    def close_folder():
+        folder = stack.pop()
+        digest = folder.digest()
+        folders[folder.path] = (digest, folder.num_files)
+        stack[-1].children.append((names.pop(), b'd', digest))
+        stack[-1].num_files += folder.num_files
+
+    for block in helpers.iter_text_blocks(in_fname):
+        cols = helpers.parse_hash_lines(block)
+        for digest, f in zip(cols.iter_digests(), cols.files):
+            i = max(f.rfind('/'), f.rfind('\\'))
+            path = f[:i] if i >= 0 else ''
+
+            if path != stack[-1].path:
+                comps = re.split(r'[/\\]', path) if path else []
+                # Close folders which are not part of the new path, open the new ones
+                k = 0
+                while k < min(len(comps), len(names)) and comps[k] == names[k]:
+                    k += 1
+                while len(names) > k:
+                    close_folder()
+                for k in range(k, len(comps)):
+                    sub_path = f[:len('/'.join(comps[:k + 1]))]
+                    if sub_path in folders:
+                        print('Error: Entries of folder {} are not grouped together, sort the list by file name first.'.format(sub_path))
+                        sys.exit(1)
+                    stack.append(_Folder(sub_path))
+                    names.append(comps[k])
+
+            stack[-1].children.append((f[i + 1:], b'f', digest))
+            stack[-1].num_files += 1
+            files[digest].append(f)
+            tot_num_files += 1
+
+    while names:
+        close_folder()
+
+    by_digest = collections.defaultdict(list)
+    for path, (digest, num_files) in folders.items():
+        by_digest[digest].append(path)
+    dup_group = {path : digest for digest, paths in by_digest.items() if len(paths) > 1 for path in paths}
+
+    def implied(paths):
+        # Duplicates are implied by their parents if every folder of one duplicate group
+        # contains exactly one of them
+        parents = [parent_folder(p) for p in paths]
+        group = dup_group.get(parents[0])
+        return group is not None and len(set(parents)) == len(parents) and set(parents) == set(by_digest[group])
+
+    groups = [paths for paths in by_digest.values() if len(paths) > 1 and not implied(paths)]
+    groups.sort(key=lambda paths: folders[paths[0]][1], reverse=True)
+
+    for paths in groups:
+        digest, num_files = folders[paths[0]]
+        print('Duplicate folders with {} files (MD5 {}):'.format(num_files, digest.hex()))
+        for path in paths:
+            print('  {}'.format(path))
+
+    # Files in the order of their hashes' first appearance in the list
+    result = {digest.hex() : paths for digest, paths in files.items() if len(paths) > 1 and not implied(paths)}
+    report_dupes(result, tot_num_files)
+
+    print('{} folders scanned'.format(len(folders)))
+    print('{} folders found with duplicates'.format(len(groups)))
+
+def group_by(func, groups, jobs=None):
+    '''Split every group of files further by the result of func.
+
+    Files for which func fails are dropped. Return a list of tuples
+    (result, files) for all groups with more than one file.
+    '''
+    res = []
+    files = [f for group in groups for f in group]
+    keys = dict(helpers.run_pool(func, files, jobs=jobs))
+    for group in groups:
+        sub_groups = collections.defaultdict(list)
+        for f in group:
+            if keys[f] is not None:
+                sub_groups[keys[f]].append(f)
+        res.extend((k, g) for k, g in sub_groups.items() if len(g) > 1)
+    return res
+
+def check_dupes_dirs(paths, jobs=None):
+    tot_num_files = 0
+    by_size = collections.defaultdict(list)
+
+    ### Stage 1: group by size
+    for path in paths:
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            for fname in sorted(filenames):
+                f = os.path.join(dirpath, fname)
+                if os.path.isfile(f) and not os.path.islink(f):
+                    tot_num_files += 1
+                    by_size[os.path.getsize(f)].append(f)
+    groups = [g for g in by_size.values() if len(g) > 1]
+
+    ### Stage 2: group by hash of first and last few KiB
+    groups = [g for _, g in group_by(helpers.file_head_tail_md5, groups, jobs)]
+
+    ### Stage 3: group by MD5 hash of whole file
+    result = dict(group_by(helpers.file_md5, groups, jobs))
+
+    report_dupes(result, tot_num_files)
+
 if __name__ == '__main__':
-    if len(sys.argv) != 2:
-        print('Error: Invalid number of arguments.')
-        sys.exit()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('path', nargs='+', help='File containing MD5 hashes (or MD5 index), or folder(s) to be searched for duplicates.')
+    parser.add_argument('--subtrees', action='store_true', help='Report duplicate folders instead of files (file containing MD5 hashes only).')
+    parser.add_argument('--jobs', type=int, default=None, metavar='N', help='Number of parallel workers (folders only).')
+    helpers.add_hash_cache_args(parser)
+    args = parser.parse_args()
+    helpers.set_hash_cache_args(args)
 
-    check_dupes(sys.argv[1])
+    if all(os.path.isdir(p) for p in args.path):
+        check_dupes_dirs(args.path, jobs=args.jobs)
+    elif len(args.path) == 1 and os.path.isfile(args.path[0]):
+        if args.subtrees:
+            check_dupes_subtrees(args.path[0])
+        else:
+            check_dupes(args.path[0])
+    else:
+        print('Error: Provide either a single file or one or more folders.')
+        sys.exit()
@@ -6,6 +6,12 @@ import sys, os, subprocess
 import rarfile
 import zipfile
 import shutil
+import pathlib
+
+# custom modules
+mod_path = pathlib.Path(__file__).resolve().parents[1]/'helpers'
+sys.path.insert(0, str(mod_path))
+import helpers
 
 MIN_PYTHON = (3, 6)
 if sys.version_info < MIN_PYTHON:
@@ -27,9 +33,7 @@ def report_warning(str):
 
 # Return MD5 hash of file
 def get_md5(fname):
-	cp = subprocess.run(["md5", "-r", fname], stdout=subprocess.PIPE, encoding='UTF-8')
-	md5 = cp.stdout.split()[0]
-	return md5
+	return helpers.file_md5(fname)
 
 def detect_type(fname):
 	ftype = ''
@@ -7,12 +7,30 @@
 # If that fails, the file is opened in encoding Latin-1 (ISO-8859-15) instead, as if created with
 # MD5Summer on Windows.
 #
-# TODO: Add variant comparing whether files in LHS checksum file are contained in RHS checksum file.
-# Don't care about files present in RHS checksum file, but missing in LHS checksum file.
+# Instead of a text file, an MD5 index built by index_md5.py can be given for either side.
+# Hashes of an index are listed in sorted order.
+#
+# With option --external, both files are sorted by hash into temporary spill files,
+# which are then merged and compared in a single pass. Memory usage is bounded by
+# SPILL_SIZE entries, independent of the size of the snapshots. The sections list
+# hashes in sorted order instead of the order in the input files.
+#
+# With option --subset, only check whether the files in the LHS checksum file are contained
+# in the RHS checksum file, e.g. whether all files of a backup disc (LHS) are present on
+# the NAS (RHS). Files present in RHS checksum file, but missing in LHS checksum file are
+# ignored. Only the hashes of the LHS are kept in memory, the RHS is streamed once (or
+# binary-searched if it is an MD5 index), so a huge RHS doesn't need much memory.
+#
 # If considering the LHS file as the older list, and the RHS file as the newer one respectively,
 # then LHS only files are files were deleted, and RHS only files were added.
 
 import sys,re,os.path, chardet
+import argparse
+import array
+import heapq
+import itertools
+import shutil
+import tempfile
 
 # custom modules
 import pathlib
@@ -20,91 +38,209 @@ mod_path = pathlib.Path(__file__).resolve().parents[1]/'helpers'
 sys.path.insert(0, str(mod_path))
 import helpers
 
-def print_usage_and_die():
-	print('Error: Invalid number of arguments.')
-	print('Usage: {} <left_file> <right_file>'.format(sys.argv[0]))
-	sys.exit()
-
-def read_file(in_fname, pos, work_list):
-
-	data = helpers.open_and_decode_file(in_fname)
-
-	# Validate pos
-	if ((pos != "left") and (pos != "right")):
-		return
-
-	lines = data.splitlines()
-	for line in lines:
-		m = helpers.split_hash_filename(line)
-		if m:
-			if not m['hash'] in work_list:
-				# First file with this hash, create empty entry
-				work_list[m['hash']] = {"left" : [], "right" : []}
-
-			work_list[m['hash']][pos].append(m['file'])
-
-def analyse_results(work_list):
-
-	rhs_only = {}
-	lhs_only = {}
-	both = {}
-
-	for m_hash in work_list:
-		v = work_list[m_hash]
-
-		if((len(v["left"]) == 0) and len(v["right"]) > 0):
-			# New files
-			if not m_hash in rhs_only:
-				rhs_only[m_hash] = []
-			for f in v["right"]:
-				rhs_only[m_hash].append(f)
-		elif((len(v["right"]) == 0) and len(v["left"]) > 0):
-			# Removed files
-			if not m_hash in lhs_only:
-				lhs_only[m_hash] = []
-			for f in v["left"]:
-				lhs_only[m_hash].append(f)
-		elif((len(v["right"]) > 0) and len(v["left"]) > 0):
-			# Identical files
-			if not m_hash in both:
-				both[m_hash] = []
-			for f in v["right"]:
-				both[m_hash].append(f)
-			for f in v["left"]:
-				both[m_hash].append(f)
+### Number of entries sorted in memory before they are written to a spill file
+SPILL_SIZE = 500000
+
+def write_spill_file(entries, tmp_dir):
+	entries.sort(key=lambda e: e[0])
+	with tempfile.NamedTemporaryFile('w', encoding='utf-8', errors='surrogateescape',
+			dir=tmp_dir, suffix='.spill', delete=False) as out_f:
+		for m_hash, m_file in entries:
+			out_f.write("{} {}\n".format(m_hash, m_file))
+	return out_f.name
+
+def read_spill_file(spill_fname):
+	with open(spill_fname, 'r', encoding='utf-8', errors='surrogateescape', newline='\n') as in_f:
+		for line in in_f:
+			yield line[:32], line[33:-1]
+
+def sort_file(in_fname, tmp_dir):
+	'''Yield all (hash, file) entries of in_fname sorted by hash.
+
+	Entries are sorted in chunks of SPILL_SIZE, which are written to spill files
+	in tmp_dir and merged. Entries with the same hash keep their order.
+	'''
+	if helpers.md5_index.is_index_file(in_fname):
+		# Already sorted, no need to spill
+		index = helpers.md5_index.MD5Index(in_fname)
+		return ((index.hash(i), index.file(i)) for i in range(len(index)))
+
+	spill_files = []
+	entries = []
+	for block in helpers.iter_text_blocks(in_fname):
+		cols = helpers.parse_hash_lines(block)
+		entries.extend(zip((d.hex() for d in cols.iter_digests()), cols.files))
+		if len(entries) >= SPILL_SIZE:
+			spill_files.append(write_spill_file(entries, tmp_dir))
+			entries = []
+	if entries:
+		spill_files.append(write_spill_file(entries, tmp_dir))
+	del entries
+
+	# heapq.merge is stable, ties are taken from the earlier spill file first
+	return heapq.merge(*[read_spill_file(f) for f in spill_files], key=lambda e: e[0])
+
+def group_sorted(entries):
+	'''Group sorted (hash, file) entries, yield (hash, [files]).'''
+	for m_hash, group in itertools.groupby(entries, key=lambda e: e[0]):
+		yield m_hash, [f for _, f in group]
+
+def merge_join(left, right):
+	'''Merge two streams of (hash, [files]) sorted by hash.
+
+	Yield (hash, left files, right files) for every hash in either stream.
+	'''
+	l = next(left, None)
+	r = next(right, None)
+	while l is not None or r is not None:
+		if r is None or (l is not None and l[0] < r[0]):
+			yield l[0], l[1], []
+			l = next(left, None)
+		elif l is None or r[0] < l[0]:
+			yield r[0], [], r[1]
+			r = next(right, None)
+		else:
+			yield l[0], l[1], r[1]
+			l = next(left, None)
+			r = next(right, None)
+
+def analyse_merged(merged, tmp_dir):
+	'''Print the results of merge_join, in the same format as analyse_results.
+
+	Identical files are printed right away, RHS and LHS files are buffered in
+	temporary files until all entries have been seen.
+	'''
+	num_rhs = num_lhs = num_both = 0
+
+	with tempfile.TemporaryFile('w+', encoding='utf-8', errors='surrogateescape', dir=tmp_dir) as rhs_f, \
+			tempfile.TemporaryFile('w+', encoding='utf-8', errors='surrogateescape', dir=tmp_dir) as lhs_f:
+
+		print("\nIdentical files:\n")
+		for m_hash, left, right in merged:
+			if left and right:
+				num_both += 1
+				for f in right + left:
+					print("{} {}".format(m_hash, f))
+			elif right:
+				num_rhs += 1
+				for f in right:
+					rhs_f.write("{} {}\n".format(m_hash, f))
+			else:
+				num_lhs += 1
+				for f in left:
+					lhs_f.write("{} {}\n".format(m_hash, f))
+
+		sys.stdout.flush()
+		print("\nRHS files:\n")
+		rhs_f.seek(0)
+		shutil.copyfileobj(rhs_f, sys.stdout)
+
+		print("\nLHS files:\n")
+		lhs_f.seek(0)
+		shutil.copyfileobj(lhs_f, sys.stdout)
+
+	print("\nStatistics")
+	print("  RHS files: {}".format(num_rhs))
+	print("  LHS files: {}".format(num_lhs))
+	print("  Both:      {}".format(num_both))
+
+def analyse_results(left, right):
+	'''Compare two ChecksumTable objects and print the results.
+
+	Both tables are sorted by hash and merge-joined. Only the positions of each
+	hash in the sorted tables are kept, the sections list the hashes in the
+	order of their first appearance in the left, then the right file.
+	'''
+	l_order = left.sorted_indices()
+	r_order = right.sorted_indices()
+
+	# Per section, five integers for every hash: first appearance, start and
+	# end in l_order, start and end in r_order
+	both, rhs_only, lhs_only = array.array('q'), array.array('q'), array.array('q')
+	for m_hash, l_pos, r_pos in merge_join(left.iter_groups(l_order), right.iter_groups(r_order)):
+		if l_pos and r_pos:
+			both.extend((l_order[l_pos[0]], *l_pos, *r_pos))
+		elif r_pos:
+			rhs_only.extend((len(left) + r_order[r_pos[0]], 0, 0, *r_pos))
 		else:
-			print("Error")
+			lhs_only.extend((l_order[l_pos[0]], *l_pos, 0, 0))
+
+	def print_section(section):
+		for k in sorted(range(0, len(section), 5), key=section.__getitem__):
+			_, l_start, l_end, r_start, r_end = section[k : k + 5]
+			if r_end:
+				m_hash = right.hash(r_order[r_start])
+			else:
+				m_hash = left.hash(l_order[l_start])
+			for i in r_order[r_start:r_end]:
+				print("{} {}".format(m_hash, right.file(i)))
+			for i in l_order[l_start:l_end]:
+				print("{} {}".format(m_hash, left.file(i)))
 
 	print("\nIdentical files:\n")
-	for m_hash in both:
-		for f in both[m_hash]:
-			print("{} {}".format(m_hash, f))
+	print_section(both)
 
 	print("\nRHS files:\n")
-	for m_hash in rhs_only:
-		for f in rhs_only[m_hash]:
-			print("{} {}".format(m_hash, f))
+	print_section(rhs_only)
 
 	print("\nLHS files:\n")
-	for m_hash in lhs_only:
-		for f in lhs_only[m_hash]:
-			print("{} {}".format(m_hash, f))
+	print_section(lhs_only)
 
 	print("\nStatistics")
-	print("  RHS files: {}".format(len(rhs_only)))
-	print("  LHS files: {}".format(len(lhs_only)))
-	print("  Both:      {}".format(len(both)))
+	print("  RHS files: {}".format(len(rhs_only) // 5))
+	print("  LHS files: {}".format(len(lhs_only) // 5))
+	print("  Both:      {}".format(len(both) // 5))
+
+def compare_external(l_file, r_file, tmp_dir=None):
+	with tempfile.TemporaryDirectory(dir=tmp_dir, prefix='compare_checksums_') as spill_dir:
+		left = group_sorted(sort_file(l_file, spill_dir))
+		right = group_sorted(sort_file(r_file, spill_dir))
+		analyse_merged(merge_join(left, right), spill_dir)
+
+def compare_subset(l_file, r_file):
+	'''Print files of l_file whose hash is not contained in r_file.'''
+	left = helpers.open_checksums(l_file)
+	missing = {left.digest(i) for i in range(len(left))}
+	num_hashes = len(missing)
+
+	if helpers.md5_index.is_index_file(r_file):
+		with helpers.md5_index.MD5Index(r_file) as right:
+			missing = {digest for digest in missing if not right.find(digest)}
+	else:
+		for block in helpers.iter_text_blocks(r_file):
+			missing.difference_update(helpers.parse_hash_lines(block).iter_digests())
+			if not missing:
+				break
+
+	num_missing = 0
+	print("\nLHS files missing in RHS:\n")
+	for i in range(len(left)):
+		if left.digest(i) in missing:
+			num_missing += 1
+			print("{} {}".format(left.hash(i), left.file(i)))
 
-if __name__ == '__main__':
-	if len(sys.argv) != 3:
-		print_usage_and_die()
-
-	work_list = {}
-
-	l_file = sys.argv[1];
-	r_file = sys.argv[2];
-
-	read_file(l_file, "left", work_list)
-	read_file(r_file, "right", work_list)
+	print("\nStatistics")
+	print("  LHS files:     {}".format(len(left)))
+	print("  Missing files: {}".format(num_missing))
+	print("  LHS hashes:    {}".format(num_hashes))
+	print("  Contained:     {}".format(num_hashes - len(missing)))
+	print("  Missing:       {}".format(len(missing)))
 
-	analyse_results(work_list)
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser()
+	parser.add_argument('left_file', help='File containing MD5 hashes (or MD5 index), e.g. of the older snapshot.')
+	parser.add_argument('right_file', help='File containing MD5 hashes (or MD5 index), e.g. of the newer snapshot.')
+	parser.add_argument('--external', action='store_true', help='Sort both files on disk, for lists larger than the available memory.')
+	parser.add_argument('--subset', action='store_true', help='Only report LHS files not contained in RHS.')
+	parser.add_argument('--tmp-dir', default=None, help='Folder for temporary spill files (default: system temp folder).')
+	args = parser.parse_args()
+
+	if args.subset:
+		compare_subset(args.left_file, args.right_file)
+	elif args.external:
+		compare_external(args.left_file, args.right_file, args.tmp_dir)
+	else:
+		left = helpers.open_checksums(args.left_file)
+		right = helpers.open_checksums(args.right_file)
+
+		analyse_results(left, right)
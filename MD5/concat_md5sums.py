@@ -1,25 +1,101 @@
 #!/usr/bin/python3
 
+# Concatenate many MD5 lists, e.g. one per disc, into a single list.
+#
+# Legacy mode: concat_md5sums.py <folder>
+#   Reads <folder>/GT001.md5 to GT290.md5, replaces '/media/cdrom0' by the disc name
+#   and writes all entries unsorted to outfile.txt.
+#
+# Merge mode: concat_md5sums.py --glob '<pattern>' [--rewrite OLD=NEW ...] [-o <out_file>]
+#   Parses all files matching the pattern in parallel, sorts the entries of each file
+#   by hash and file name, and merges them into a single sorted list. In NEW, {stem} is
+#   replaced by the name of the input file without extension, e.g.
+#   --rewrite '/media/cdrom0={stem}' turns '/media/cdrom0/x.txt' in GT001.md5 into
+#   'GT001/x.txt'. The result is sorted by hash, as expected by sort-free comparisons.
+
 import sys,re,os.path
+import argparse
+import concurrent.futures
+import glob
+import heapq
+
+# custom modules
+import pathlib
+mod_path = pathlib.Path(__file__).resolve().parents[1]/'helpers'
+sys.path.insert(0, str(mod_path))
+import helpers
+
+def concat_legacy(in_dir):
+	pattern = re.compile(r"([0-9a-f]{32})(\s+\**)(.*)")
+	with open('outfile.txt', 'w') as out_file:
+		for i in range(1,291):
+			gt = 'GT{:03}'.format(i)
+			filename = '{}/{}.md5'.format(in_dir, gt)
+			print(filename)
+			with open(filename, 'r') as in_file:
+				for line in in_file:
+					m = re.search(pattern, line)
+					if m:
+						m_hash = m.group(1)
+						m_file = m.group(3)
+					m_file = m_file.replace('/media/cdrom0', gt)
+					entry = '{}  {}\n'.format(m_hash, m_file)
+					out_file.write(entry)
+					print(entry)
+
+def parse_rewrite(rule):
+	'''Split rewrite rule OLD=NEW into a tuple (OLD, NEW).'''
+	old, sep, new = rule.partition('=')
+	if not sep or not old:
+		raise argparse.ArgumentTypeError("invalid rewrite rule '{}', expected OLD=NEW".format(rule))
+	return old, new
+
+def read_sorted(in_fname, rewrites):
+	'''Read MD5 list in_fname, apply rewrites to the file names and return
+	a list of (hash, file) tuples sorted by hash and file name.'''
+	stem = pathlib.Path(in_fname).stem
+	rewrites = [(old, new.replace('{stem}', stem)) for old, new in rewrites]
+
+	table = helpers.read_checksum_table(in_fname)
+	entries = []
+	for i in range(len(table)):
+		m_file = table.file(i)
+		for old, new in rewrites:
+			m_file = m_file.replace(old, new)
+		entries.append((table.hash(i), m_file))
+	entries.sort()
+	return entries
+
+def concat_merge(in_fnames, out_fname, rewrites, jobs=None):
+	num_entries = 0
+	with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+		sorted_lists = list(executor.map(read_sorted, in_fnames, [rewrites] * len(in_fnames)))
+
+	with open(out_fname, 'w', encoding='utf-8') as out_file:
+		for m_hash, m_file in heapq.merge(*sorted_lists):
+			out_file.write('{}  {}\n'.format(m_hash, m_file))
+			num_entries += 1
+
+	print('{} files with {} entries merged into {}'.format(len(in_fnames), num_entries, out_fname))
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser()
+	parser.add_argument('folder', nargs='?', help='Folder containing GT001.md5 to GT290.md5 (legacy mode).')
+	parser.add_argument('--glob', metavar='PATTERN', help='Merge all MD5 lists matching PATTERN, e.g. "lists/GT*.md5".')
+	parser.add_argument('--rewrite', metavar='OLD=NEW', type=parse_rewrite, action='append', default=[],
+		help='Replace OLD by NEW in all file names, {stem} in NEW is replaced by the input file name without extension. Can be repeated.')
+	parser.add_argument('-o', '--output', default='outfile.txt', help='Output file (default: %(default)s).')
+	parser.add_argument('--jobs', type=int, default=None, metavar='N', help='Number of parallel processes.')
+	args = parser.parse_args()
 
-if len(sys.argv) != 2:
-	print('Argument missing')
-	sys.exit(1)
-
-with open('outfile.txt', 'w') as out_file:
-	for i in range(1,291):
-		gt = 'GT{:03}'.format(i)
-		filename = '{}/{}.md5'.format(sys.argv[1], gt)
-		print(filename)
-		with open(filename, 'r') as in_file:
-			for line in in_file:
-				pattern = re.compile("([0-9a-f]{32})(\s+\**)(.*)")
-				m = re.search(pattern, line)
-				if m:
-					m_hash = m.group(1)
-					m_file = m.group(3)
-				m_file = m_file.replace('/media/cdrom0', gt)
-				entry = '{}  {}\n'.format(m_hash, m_file)
-				out_file.write(entry)
-				print(entry)
-		
+	if args.glob:
+		in_fnames = sorted(glob.glob(args.glob))
+		if not in_fnames:
+			print('Error: No files matching {}'.format(args.glob))
+			sys.exit(1)
+		concat_merge(in_fnames, args.output, args.rewrite, jobs=args.jobs)
+	elif args.folder:
+		concat_legacy(args.folder)
+	else:
+		print('Argument missing')
+		sys.exit(1)
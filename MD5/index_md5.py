@@ -0,0 +1,77 @@
+#! /usr/bin/python3
+
+# Build a sorted binary index (.md5idx) from a file containing hashes and filenames
+# (as generated by md5sum or MD5Summer), and look up hashes or files in it.
+# The index is memory-mapped and binary-searched, so a lookup doesn't need to parse
+# the whole list again. The index can also be used by check_dupes.py and
+# compare_checksums.py instead of the text list.
+#
+# Usage:
+#   index_md5.py build <md5_file> [...]             creates <md5_file>.md5idx
+#   index_md5.py lookup <md5idx_file> <hash|file> [...]
+
+import sys
+import os.path
+import re
+import argparse
+import pathlib
+
+# custom modules
+mod_path = pathlib.Path(__file__).resolve().parents[1]/'helpers'
+sys.path.insert(0, str(mod_path))
+import helpers
+import md5_index
+
+def build_index(in_fname, out_fname):
+	table = helpers.read_checksum_table(in_fname)
+	md5_index.write_index(table, out_fname)
+	print('{}: {} entries written to {}'.format(in_fname, len(table), out_fname))
+
+def lookup(index_fname, queries):
+	'''Look up hashes or files (hashed first) in the index.
+
+	Return the number of queries not found.
+	'''
+	num_missing = 0
+	with md5_index.MD5Index(index_fname) as index:
+		for query in queries:
+			if re.fullmatch(r'[0-9a-fA-F]{32}', query):
+				m_hash = query.lower()
+			elif os.path.isfile(query):
+				m_hash = helpers.file_md5(query)
+			else:
+				print('Error: {} is neither a hash nor a file'.format(query))
+				num_missing += 1
+				continue
+
+			files = index.lookup(m_hash)
+			if files:
+				print('Found {} ({}):'.format(query, m_hash))
+				for f in files:
+					print('  {}'.format(f))
+			else:
+				print('Not found {} ({})'.format(query, m_hash))
+				num_missing += 1
+	return num_missing
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser()
+	subparsers = parser.add_subparsers(dest='command', required=True)
+
+	p_build = subparsers.add_parser('build', help='Build index from MD5 list(s).')
+	p_build.add_argument('path', nargs='+', help='File(s) containing MD5 hashes.')
+
+	p_lookup = subparsers.add_parser('lookup', help='Look up hashes or files in an index.')
+	p_lookup.add_argument('index', help='MD5 index file.')
+	p_lookup.add_argument('query', nargs='+', help='MD5 hash(es) or file(s) to be hashed.')
+	helpers.add_hash_cache_args(p_lookup)
+
+	args = parser.parse_args()
+
+	if args.command == 'build':
+		for in_fname in args.path:
+			build_index(in_fname, in_fname + '.md5idx')
+	else:
+		helpers.set_hash_cache_args(args)
+		if lookup(args.index, args.query):
+			sys.exit(1)
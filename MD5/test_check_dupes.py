@@ -0,0 +1,68 @@
+#!/usr/bin/python3
+
+import hashlib
+import check_dupes
+
+def md5(content):
+    return hashlib.md5(content.encode('utf-8')).hexdigest()
+
+def run_subtrees(tmp_path, capsys, entries):
+    in_fname = tmp_path / 'list.md5'
+    in_fname.write_text(''.join('{}  {}\n'.format(md5(content), f) for f, content in entries), encoding='utf-8')
+    check_dupes.check_dupes_subtrees(str(in_fname))
+    return capsys.readouterr().out
+
+def reported(out, header):
+    '''Return list of the groups of paths listed below lines starting with header.'''
+    groups = []
+    group = None
+    for line in out.splitlines():
+        if line.startswith('  '):
+            if group is not None:
+                group.append(line.strip())
+        else:
+            group = [] if line.startswith(header) else None
+            if group is not None:
+                groups.append(group)
+    return groups
+
+def test_subtrees_nested(tmp_path, capsys):
+    out = run_subtrees(tmp_path, capsys, [
+        ('./A/sub/1.mp3', 'x'), ('./A/sub/2.mp3', 'y'), ('./A/3.mp3', 'z'),
+        ('./B/sub/1.mp3', 'x'), ('./B/sub/2.mp3', 'y'), ('./B/3.mp3', 'z'),
+    ])
+    # Only A and B, the duplicate sub-folders and files are implied
+    assert reported(out, 'Duplicate folders') == [['./A', './B']]
+    assert reported(out, 'Duplicates with MD5') == []
+    assert '0 hashes found with duplicates' in out
+
+def test_subtrees_partial_overlap(tmp_path, capsys):
+    out = run_subtrees(tmp_path, capsys, [
+        ('./A/X/1.mp3', 'x'), ('./A/a.mp3', 'a'),
+        ('./B/X/1.mp3', 'x'), ('./B/b.mp3', 'b'),
+        ('./C/X/1.mp3', 'x'), ('./C/a.mp3', 'a'),
+        ('./D/X/1.mp3', 'x'), ('./D/b.mp3', 'b'),
+    ])
+    # A = C and B = D, X is duplicated across both groups and must be reported
+    assert sorted(reported(out, 'Duplicate folders')) == [['./A', './C'], ['./A/X', './B/X', './C/X', './D/X'], ['./B', './D']]
+    assert reported(out, 'Duplicates with MD5') == []
+
+def test_subtrees_file_dupes(tmp_path, capsys):
+    out = run_subtrees(tmp_path, capsys, [
+        ('./A/1.mp3', 'x'), ('./B/1.mp3', 'x'),
+        ('./C/x.mp3', 'c'), ('./C/other.mp3', 'o'),
+        ('./D/y.mp3', 'c'),
+        ('./E/z.mp3', 'x'),
+    ])
+    assert reported(out, 'Duplicate folders') == [['./A', './B']]
+    # Duplicates outside duplicate folders, or also outside of them, are reported
+    assert reported(out, 'Duplicates with MD5') == [['./A/1.mp3', './B/1.mp3', './E/z.mp3'], ['./C/x.mp3', './D/y.mp3']]
+
+def test_subtrees_dupes_within_folder(tmp_path, capsys):
+    out = run_subtrees(tmp_path, capsys, [
+        ('./A/1.mp3', 'x'), ('./A/copy.mp3', 'x'), ('./A/S/1.mp3', 'y'), ('./A/T/1.mp3', 'y'),
+        ('./B/1.mp3', 'x'), ('./B/copy.mp3', 'x'), ('./B/S/1.mp3', 'y'), ('./B/T/1.mp3', 'y'),
+    ])
+    # Duplicates within A (and B) are not explained by A = B alone
+    assert sorted(reported(out, 'Duplicate folders')) == [['./A', './B'], ['./A/S', './A/T', './B/S', './B/T']]
+    assert reported(out, 'Duplicates with MD5') == [['./A/1.mp3', './A/copy.mp3', './B/1.mp3', './B/copy.mp3']]
@@ -0,0 +1,62 @@
+#!/usr/bin/python3
+
+import pathlib
+import functools
+import compare_checksums
+
+PHOTOS = pathlib.Path(__file__).resolve().parent / 'test_files_photos'
+
+def sections(out):
+	'''Return dict of section header : list of lines of the section.'''
+	res = {}
+	lines = None
+	for line in out.splitlines():
+		if line.endswith(':') or line == 'Statistics':
+			lines = res.setdefault(line.strip(), [])
+		elif line and lines is not None:
+			lines.append(line.strip())
+	return res
+
+def test_external(tmp_path, monkeypatch, capsys):
+	# Photos of the test folder, plus one file only in the LHS and two with the same hash only in the RHS
+	l_file, r_file = str(tmp_path / 'lhs.md5'), str(tmp_path / 'rhs.md5')
+	with open(l_file, 'w') as f:
+		f.write((PHOTOS / 'photos_lhs.md5').read_text() + '{} ./DSC07000.JPG\n'.format('0' * 32))
+	with open(r_file, 'w') as f:
+		f.write((PHOTOS / 'photos_rhs.md5').read_text() + '{0} ./Event3/a.JPG\n{0} ./Event3/b.JPG\n'.format('f' * 32))
+	compare_checksums.analyse_results(compare_checksums.helpers.open_checksums(l_file), compare_checksums.helpers.open_checksums(r_file))
+	in_memory = sections(capsys.readouterr().out)
+
+	# Force several spill files per side, the list is read in blocks of about two lines
+	spill_files = []
+	write_spill_file = compare_checksums.write_spill_file
+	def spy(entries, tmp_dir):
+		spill_files.append(write_spill_file(entries, tmp_dir))
+		return spill_files[-1]
+	monkeypatch.setattr(compare_checksums, 'SPILL_SIZE', 3)
+	monkeypatch.setattr(compare_checksums.helpers, 'iter_text_blocks', functools.partial(compare_checksums.helpers.iter_text_blocks, block_size=100))
+	monkeypatch.setattr(compare_checksums, 'write_spill_file', spy)
+	spill_dir = tmp_path / 'spill'
+	spill_dir.mkdir()
+	compare_checksums.compare_external(l_file, r_file, str(spill_dir))
+	external = sections(capsys.readouterr().out)
+
+	assert len(spill_files) >= 4
+	assert list(spill_dir.iterdir()) == []
+	assert external['Statistics'] == in_memory['Statistics']
+	assert (len(in_memory['Identical files:']), len(in_memory['RHS files:']), len(in_memory['LHS files:'])) == (16, 2, 1)
+	# Hashes are listed in sorted order, the files of every hash in the same order
+	for section in ['Identical files:', 'RHS files:', 'LHS files:']:
+		assert external[section] == sorted(in_memory[section], key=lambda line: line[:32])
+
+def test_subset(tmp_path, capsys):
+	lhs = tmp_path / 'lhs.md5'
+	rhs = tmp_path / 'rhs.md5'
+	lhs.write_text('{}  ./a.jpg\n{}  ./b.jpg\n{}  ./copy of b.jpg\n{}  ./c.jpg\n'.format('1' * 32, '2' * 32, '2' * 32, '3' * 32))
+	rhs.write_text('{}  ./x/a.jpg\n{}  ./x/c.jpg\n{}  ./x/d.jpg\n'.format('1' * 32, '3' * 32, '4' * 32))
+
+	compare_checksums.compare_subset(str(lhs), str(rhs))
+	res = sections(capsys.readouterr().out)
+	# Only LHS files are reported, RHS only files are ignored
+	assert res['LHS files missing in RHS:'] == ['{} ./b.jpg'.format('2' * 32), '{} ./copy of b.jpg'.format('2' * 32)]
+	assert res['Statistics'] == ['LHS files:     4', 'Missing files: 2', 'LHS hashes:    3', 'Contained:     2', 'Missing:       1']
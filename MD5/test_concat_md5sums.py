@@ -0,0 +1,26 @@
+#!/usr/bin/python3
+
+import argparse
+import pytest
+import concat_md5sums
+
+def test_parse_rewrite():
+	assert concat_md5sums.parse_rewrite('/media/cdrom0={stem}') == ('/media/cdrom0', '{stem}')
+	assert concat_md5sums.parse_rewrite('a=b=c') == ('a', 'b=c')
+	with pytest.raises(argparse.ArgumentTypeError):
+		concat_md5sums.parse_rewrite('/media/cdrom0')
+
+def test_concat_merge(tmp_path):
+	(tmp_path / 'GT001.md5').write_text('{}  /media/cdrom0/z.txt\n{}  /media/cdrom0/a.txt\n'.format('3' * 32, '1' * 32))
+	(tmp_path / 'GT002.md5').write_text('{}  /media/cdrom0/b.txt\n{}  /media/cdrom0/dir/a.txt\n'.format('1' * 32, '2' * 32))
+	out_fname = tmp_path / 'merged.md5'
+
+	concat_md5sums.concat_merge([str(tmp_path / 'GT001.md5'), str(tmp_path / 'GT002.md5')], str(out_fname),
+		[concat_md5sums.parse_rewrite('/media/cdrom0={stem}'), ('dir/', 'Dir/')], jobs=2)
+	# Sorted by hash, then by file name
+	assert out_fname.read_text().splitlines() == [
+		'{}  GT001/a.txt'.format('1' * 32),
+		'{}  GT002/b.txt'.format('1' * 32),
+		'{}  GT002/Dir/a.txt'.format('2' * 32),
+		'{}  GT001/z.txt'.format('3' * 32),
+	]
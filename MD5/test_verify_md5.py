@@ -0,0 +1,25 @@
+#!/usr/bin/python3
+
+import hashlib
+import pytest
+import verify_md5
+
+@pytest.mark.parametrize('ordered', [True, False])
+def test_verify_files(tmp_path, monkeypatch, capsys, ordered):
+	monkeypatch.setattr(verify_md5.helpers.hash_cache_usage, 'mode', 'off')
+	(tmp_path / 'lib' / 'sub').mkdir(parents=True)
+	(tmp_path / 'lib' / 'a.txt').write_text('a\n')
+	(tmp_path / 'lib' / 'sub' / 'b.txt').write_text('b\n')
+	(tmp_path / 'lib' / 'c.txt').write_text('modified\n')
+	md5 = lambda content: hashlib.md5(content.encode()).hexdigest()
+
+	# md5sum and MD5Summer format, relative to --base-dir
+	(tmp_path / 'list.md5').write_text('{}  a.txt\n{}  c.txt\n{}  missing.txt\n'.format(md5('a\n'), md5('c\n'), md5('x\n')))
+	(tmp_path / 'list_win.md5').write_bytes('{} *sub\\b.txt\r\n'.format(md5('b\n')).encode('latin-1'))
+
+	counts = verify_md5.verify_files([str(tmp_path / 'list.md5'), str(tmp_path / 'list_win.md5')],
+		base_dir=str(tmp_path / 'lib'), jobs=2, ordered=ordered)
+	assert counts == {'OK' : 2, 'FAILED' : 1, 'MISSING' : 1}
+	lines = [line for line in capsys.readouterr().out.splitlines() if line.endswith(('OK', 'FAILED', 'MISSING'))]
+	expected = ['a.txt: OK', 'c.txt: FAILED', 'missing.txt: MISSING', 'sub\\b.txt: OK', '2 OK, 1 FAILED, 1 MISSING']
+	assert lines == expected if ordered else sorted(lines) == sorted(expected)
@@ -28,8 +28,7 @@ def sort_file(in_fname, out_fname):
 	with open(out_fname, 'w', encoding='utf-8') as out_f:
 
 		table = []
-		data = helpers.open_and_decode_file(in_fname)
-		for line in data.splitlines():
+		for line in helpers.iter_lines(in_fname):
 
 			item = helpers.split_hash_filename(line)
 			if item:
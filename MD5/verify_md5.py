@@ -0,0 +1,116 @@
+#! /usr/bin/python3
+
+# Verify files against a file containing hashes and filenames, like md5sum -c, but with
+# several files hashed in parallel.
+# Lists created by md5sum (UTF-8) and by MD5Summer on Windows (Latin-1, '*' before the
+# file name, backslashes as separators) are supported.
+# Relative file names are resolved against --base-dir, by default the current folder as
+# with md5sum -c.
+# The hash cache is not used, every file is read completely.
+#
+# Every file is reported as OK, FAILED (hash differs or file not readable) or MISSING.
+# The exit code is 1 if any file is not OK.
+
+import sys
+import os.path
+import time
+import argparse
+import pathlib
+
+# custom modules
+mod_path = pathlib.Path(__file__).resolve().parents[1]/'helpers'
+sys.path.insert(0, str(mod_path))
+import helpers
+
+### Minimum interval in seconds between two progress updates
+PROGRESS_INTERVAL = 0.5
+
+def read_manifest(in_fname, base_dir=None):
+	'''Return list of (file name as in list, path, hash) of all entries in in_fname.'''
+	entries = []
+	for item in helpers.iter_hash_records(in_fname):
+		path = item['file']
+		if os.sep != '\\':
+			path = path.replace('\\', os.sep)
+		if base_dir:
+			path = os.path.join(base_dir, path)
+		entries.append((item['file'], path, item['hash'].lower()))
+	return entries
+
+def check_entry(entry):
+	'''Return tuple (status, number of bytes read) for entry.'''
+	_, path, m_hash = entry
+	try:
+		size = os.path.getsize(path)
+		status = 'OK' if helpers.file_md5(path) == m_hash else 'FAILED'
+	except FileNotFoundError:
+		return 'MISSING', 0
+	except OSError as e:
+		print('Error reading {}: {}'.format(path, e), file=sys.stderr)
+		return 'FAILED', 0
+	return status, size
+
+class Progress():
+	'''Number of files and bytes done, printed to stderr while running.'''
+
+	def __init__(self, total, live):
+		self.total = total
+		self.live = live
+		self.num_files = 0
+		self.num_bytes = 0
+		self.start = time.monotonic()
+		self._last = 0
+
+	def update(self, num_bytes):
+		self.num_files += 1
+		self.num_bytes += num_bytes
+		now = time.monotonic()
+		if self.live and now - self._last >= PROGRESS_INTERVAL:
+			self._last = now
+			sys.stderr.write('\r{}/{} files, {}'.format(self.num_files, self.total, self.throughput()))
+			sys.stderr.flush()
+
+	def throughput(self):
+		elapsed = max(time.monotonic() - self.start, 1e-6)
+		mib = self.num_bytes / (1024 * 1024)
+		return '{:.1f} MiB in {:.1f} s ({:.1f} MiB/s)'.format(mib, elapsed, mib / elapsed)
+
+	def finish(self):
+		if self.live:
+			sys.stderr.write('\r' + ' ' * 79 + '\r')
+			sys.stderr.flush()
+
+def verify_files(in_fnames, base_dir=None, jobs=None, ordered=True, quiet=False):
+	'''Verify all entries in the lists in_fnames, return dict of counts per status.'''
+	entries = []
+	for in_fname in in_fnames:
+		entries.extend(read_manifest(in_fname, base_dir))
+
+	counts = {'OK' : 0, 'FAILED' : 0, 'MISSING' : 0}
+	progress = Progress(len(entries), sys.stderr.isatty())
+
+	for entry, (status, num_bytes) in helpers.run_pool(check_entry, entries, jobs=jobs, ordered=ordered):
+		counts[status] += 1
+		progress.update(num_bytes)
+		if status != 'OK' or not quiet:
+			print('{}: {}'.format(entry[0], status))
+
+	progress.finish()
+	print('{} OK, {} FAILED, {} MISSING'.format(counts['OK'], counts['FAILED'], counts['MISSING']))
+	print(progress.throughput(), file=sys.stderr)
+	return counts
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser()
+	parser.add_argument('path', nargs='+', help='File(s) containing MD5 hashes.')
+	parser.add_argument('--base-dir', default=None, help='Folder relative file names are resolved against (default: current folder).')
+	parser.add_argument('--jobs', type=int, default=None, metavar='N', help='Number of parallel workers.')
+	parser.add_argument('--unordered', action='store_true', help='Report files as soon as they are done instead of in the order of the list.')
+	parser.add_argument('--quiet', action='store_true', help="Don't print OK for every successfully verified file.")
+	args = parser.parse_args()
+
+	helpers.set_hash_cache_mode('off')
+
+	counts = verify_files(args.path, base_dir=args.base_dir, jobs=args.jobs, ordered=not args.unordered, quiet=args.quiet)
+	if counts['FAILED'] or counts['MISSING']:
+		sys.exit(1)
@@ -243,17 +243,25 @@ def compare_folders(pathA, pathB):
 #plot_dual(w1, w2, offsets)
 
 def print_usage_and_die():
-    print('Usage fileA|pathA fileB|pathB')
+    print('Usage [--no-cache|--verify-cache] fileA|pathA fileB|pathB')
     print('Note: either provide two files or two paths')
     sys.exit(0)
 
 if __name__ == '__main__':
-    if len(sys.argv) != 3:
+    args = sys.argv[1:]
+    if '--no-cache' in args:
+        args.remove('--no-cache')
+        helpers.set_hash_cache_mode('off')
+    if '--verify-cache' in args:
+        args.remove('--verify-cache')
+        helpers.set_hash_cache_mode('verify')
+
+    if len(args) != 2:
         print('missing input file(s)/path(s)')
         print_usage_and_die()
     else:
-        pathA = sys.argv[1]
-        pathB = sys.argv[2]
+        pathA = args[0]
+        pathB = args[1]
         if os.path.isdir(pathA) and os.path.isdir(pathB):
             compare_folders(pathA, pathB)
         elif os.path.isfile(pathA) and os.path.isfile(pathB):
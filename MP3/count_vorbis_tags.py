@@ -14,9 +14,9 @@ def collect_file_info(dir_name):
     for filename in glob.glob(dir_name+'/**/*.*', recursive=True):
         _,ext = os.path.splitext(filename)
         if ext in ['.mp3', '.flac']:
-            f = extract_tags.FileInfo(filename)
+            f = extract_tags.get_file_info(filename)
             file_info.append(f)
-    return sorted(file_info)
+    return sorted(file_info, key=lambda f: f.sort_key)
 
 def dump_all_tags(file_info):
     expected_tags = ['t_artist', 't_album', 't_track', 't_title', 't_genre', 't_date']
@@ -65,10 +65,14 @@ def print_usage_and_die():
     print("""Usage:
     -d <top_dir>     Dump all tags in given directory.
     -m <top_dir>     Dump missing tags for files in given directory.
+    --no-tag-cache   Read the tags of all files instead of using the tag cache.
     """)
     sys.exit(1)
     
 if __name__ == "__main__":
+    if '--no-tag-cache' in sys.argv:
+        sys.argv.remove('--no-tag-cache')
+        extract_tags.set_tag_cache_mode('off')
     # Require at least one argument
     if len(sys.argv) < 3:
         print_usage_and_die()
@@ -46,6 +46,15 @@ import os.path
 import pathlib
 import csv
 import argparse
+import functools
+import hashlib
+import concurrent.futures
+
+# optional modules
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
 
 # custom modules
 mod_path = pathlib.Path(__file__).resolve().parents[1]/'helpers'
@@ -76,6 +85,9 @@ class ViolationCounter:
 
 violations = ViolationCounter()
 
+### Number of CSV rows written at once by extract_tags_to_csv, the journal is updated after each batch
+CSV_BATCH_SIZE = 500
+
 field_names = [
     'f_artist',         # artist (from filename)
     'f_album',          # album (from filename)
@@ -116,6 +128,32 @@ class LengthTracker:
         if self.stats_min[k] and l < len(self.stats_min[k]) or not self.stats_min[k]:
             self.stats_min[k] = v
 
+    def check_lengths(self, full_paths):
+        '''
+            Same as check_length() for all paths in list full_paths.
+        '''
+        if full_paths:
+            self.check_length(min(full_paths, key=len))
+            self.check_length(max(full_paths, key=len))
+
+    def check_column(self, k, values):
+        '''
+            Same as check_tag() for all values in list values.
+        '''
+        if not values:
+            return
+        longest = max(values, key=len)
+        if self.stats_max[k] and len(longest) > len(self.stats_max[k]) or not self.stats_max[k]:
+            self.stats_max[k] = longest
+        if '' in values:
+            # check_tag() takes any value following an empty one as new minimum
+            rest = values[len(values) - values[::-1].index(''):]
+            self.stats_min[k] = min(rest, key=len) if rest else ''
+        else:
+            shortest = min(values, key=len)
+            if self.stats_min[k] and len(shortest) < len(self.stats_min[k]) or not self.stats_min[k]:
+                self.stats_min[k] = shortest
+
 len_tracker = LengthTracker()
 
 
@@ -283,55 +321,200 @@ def my_print(str):
     if 'uni_stdout' in globals():
         print(str, file=uni_stdout)
 
+def my_eprint(str):
+    """
+        Like my_print, but to stderr, for diagnostics which must not mix with the MD5 hashes
+        written to stdout.
+    """
+    if 'uni_stderr' in globals():
+        print(str, file=uni_stderr)
+
 def tag_from_fileinfo(fi, field_names):
     # Create a dict with keys from field_names and values from fileinfo
     tag = {t : fi[t] for t in field_names}
     return tag
 
-def parse_file(top_dir, full_path, md5_fh):
+def check_file(top_dir, full_path):
+    """
+        Check naming rules of a file below top_dir.
 
+        Return value: True if the file should be hashed; False otherwise
+    """
     path_rel = pathlib.PurePath(full_path).relative_to(top_dir)
 
     if len(path_rel.parts) != 3:
-        my_print(f'violation: invalid file: {full_path}')
-        return 1, None
+        my_eprint(f'violation: invalid file: {full_path}')
+        return False
 
     fname = path_rel.parts[2]
     if not is_valid_mp3_filename(fname):
         violations.add_violation(f"violation: rule_3b: filenames must have format 'xx - Trackname.mp3', but got: {path_rel.parts[-3:]}")
+        return False
+    return True
+
+def parse_file(top_dir, full_path, manifests):
+
+    if not check_file(top_dir, full_path):
         return 1, None
-    
-    md5 = helpers.file_md5(full_path)
-    str = f'{md5}  {path_rel}\n'
-    if md5_fh:
-        md5_fh.write(str)
-    else:
-        print(str, end='')
+
+    manifests.write(top_dir, full_path, manifests.hash(top_dir, full_path))
 
     return 0, None
 
 
-def extract_tags_to_csv(top_dir, csv_file):
+def journal_name(csv_file):
+    """
+        Return file name of the checkpoint journal of csv_file.
+    """
+    return f'{csv_file}.journal'
+
+def hash_file_list(files):
+    """
+        Return hex digest identifying the list of files (names and order).
+    """
+    h = hashlib.sha1()
+    for filename in files:
+        h.update(os.fsencode(filename))
+        h.update(b'\0')
+    return h.hexdigest()
+
+def read_journal(csv_file):
+    """
+        Return tuple (file list hash, number of files done, size of csv_file) of the last
+        checkpoint, or None if there is no valid journal.
+    """
+    try:
+        with open(journal_name(csv_file), mode='r', encoding='utf-8') as f:
+            files_hash, num_done, csv_size = f.read().split()
+        return files_hash, int(num_done), int(csv_size)
+    except (OSError, ValueError):
+        return None
+
+def write_journal(csv_file, files_hash, num_done, csv_size):
+    """
+        Atomically replace the journal of csv_file by a new checkpoint.
+    """
+    fname = journal_name(csv_file)
+    with open(fname + '.tmp', mode='w', encoding='utf-8') as f:
+        f.write(f'{files_hash} {num_done} {csv_size}\n')
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(fname + '.tmp', fname)
+
+def iter_file_infos(files, jobs=1):
+    """
+        Yield FileInfo of all files in order, read by jobs processes.
+    """
+    if jobs > 1:
+        # Look up the tag cache here, only the files not found are read in the worker
+        # processes. map returns them in the order of files.
+        cached = [extract_tags.lookup_file_info(full_path) for full_path in files]
+        misses = [full_path for full_path, fi in zip(files, cached) if fi is None]
+        chunksize = max(1, min(64, len(misses) // (4 * jobs)))
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = executor.map(extract_tags.read_file_info, misses, chunksize=chunksize)
+            for fi in cached:
+                if fi is None:
+                    st, fi = next(results)
+                    extract_tags.store_file_info(st, fi)
+                yield fi
+    else:
+        for full_path in files:
+            yield extract_tags.get_file_info(full_path)
+
+def collect_tag_files(top_dir):
+    """
+        Return list of all MP3 and FLAC files below top_dir.
+    """
     files = []
     # compile file list, note: glob will also catch folders with dots somewhere in the name
     for filename in glob.glob(top_dir+'/**/*.*', recursive=True):
         _, ext = os.path.splitext(filename)
         if ext in ['.mp3', '.flac']:
             files.append(filename)
-    # 
+    return files
+
+def extract_tags_to_csv(top_dir, csv_file, jobs=1, resume=False):
+    """
+        Extract tags of all MP3 and FLAC files below top_dir to csv_file.
+
+        Rows are written in batches of CSV_BATCH_SIZE. After each batch, the number of
+        files done is recorded in the journal next to csv_file, so that an interrupted
+        run can be continued with resume=True. The journal is removed when done.
+    """
+    files = collect_tag_files(top_dir)
     if len(files) == 0:
         print('No files found')
         return
 
+    files_hash = hash_file_list(files)
+    num_done = 0
+    csv_size = None
+    if resume:
+        journal = read_journal(csv_file)
+        if journal is None or not os.path.isfile(csv_file) or os.path.getsize(csv_file) < journal[2]:
+            print(f'No checkpoint for {csv_file} found, starting from scratch')
+        elif journal[0] != files_hash:
+            print(f'File list changed since the checkpoint of {csv_file}, starting from scratch')
+        else:
+            _, num_done, csv_size = journal
+            print(f'Resuming {csv_file} after {num_done} of {len(files)} files')
+
     ### Open CSV file
-    with open(csv_file, mode='w+', encoding='utf-8', errors='surrogateescape') as csv_fh:
+    if csv_size is None:
+        csv_fh = open(csv_file, mode='w+', encoding='utf-8', errors='surrogateescape')
+    else:
+        # Drop rows written after the last checkpoint
+        csv_fh = open(csv_file, mode='r+', encoding='utf-8', errors='surrogateescape')
+        csv_fh.truncate(csv_size)
+        csv_fh.seek(csv_size)
+
+    with csv_fh:
         csv_wh = csv.DictWriter(csv_fh, fieldnames=field_names, dialect='mp3_csv')
-        csv_wh.writeheader()
+        if csv_size is None:
+            csv_wh.writeheader()
+
+        rows = []
+        for fi in iter_file_infos(files[num_done:], jobs=jobs):
+            rows.append(tag_from_fileinfo(fi, field_names))
+            num_done += 1
+            if len(rows) >= CSV_BATCH_SIZE or num_done == len(files):
+                csv_wh.writerows(rows)
+                rows.clear()
+                csv_fh.flush()
+                os.fsync(csv_fh.fileno())
+                write_journal(csv_file, files_hash, num_done, os.fstat(csv_fh.fileno()).st_size)
+
+    os.remove(journal_name(csv_file))
+
+def extract_tags_to_catalog(top_dir, db_file, jobs=1, resume=False):
+    """
+        Extract tags of all MP3 and FLAC files below top_dir to the SQLite tag catalog
+        db_file, with the columns of field_names.
 
-        for full_path in files:
-            fi = extract_tags.FileInfo(full_path)
-            tag = tag_from_fileinfo(fi, field_names)
-            csv_wh.writerow(tag)
+        Rows are committed in batches of CSV_BATCH_SIZE. With resume=True, files already
+        in the catalog are skipped, otherwise the catalog is cleared first.
+    """
+    files = collect_tag_files(top_dir)
+    if len(files) == 0:
+        print('No files found')
+        return
+
+    with extract_tags.open_tag_catalog(db_file, field_names) as catalog:
+        if resume:
+            done = catalog.file_names()
+            files = [full_path for full_path in files if full_path not in done]
+            print(f'Resuming {db_file}, {len(files)} files left')
+        else:
+            catalog.clear()
+
+        rows = []
+        for fi in iter_file_infos(files, jobs=jobs):
+            rows.append((fi.file_name, tag_from_fileinfo(fi, field_names)))
+            if len(rows) >= CSV_BATCH_SIZE:
+                catalog.add(rows)
+                rows.clear()
+        catalog.add(rows)
 
 def report_mismatch(fname, item, f_item, t_item):
     violations.add_violation('Mismatch in {}, file: {} tag: {} (file: {})'.format(item, f_item, t_item, fname))
@@ -409,6 +592,48 @@ def match_album_artist(tag):
     ### Still not matching -> error
     return False
 
+### Standard replacements applied by std_repl(), per category
+std_substitutions = {
+    "AR" : {
+        ### Note: first entries for ':' and '/' are homoglyps!
+        ':' : ['∶'],
+        '/' : ['⁄'],
+        '?' : [''],
+    },
+    "AL" : {
+        ### Note: first entries for ':' and '/' are homoglyps!
+        ':' : ['∶'],
+        '/' : ['⁄'],
+        '?' : [''],
+        '>' : ['-'],
+        '=' : ['-'],
+    },
+}
+
+def std_canonical_pattern(subs):
+    """
+        Return compiled pattern matching all characters replaced or inserted by subs.
+    """
+    chars = {c for v in subs for c in v + ''.join(subs[v])}
+    return re.compile('[{}]'.format(re.escape(''.join(sorted(chars)))))
+
+### Patterns used by std_canonical(), per category
+std_canonical_patterns = {cat : std_canonical_pattern(subs) for cat, subs in std_substitutions.items()}
+
+@functools.lru_cache(maxsize=None)
+def std_canonical(cat, item):
+    """
+        Return canonical form of item for std_repl(): all characters touched by the
+        standard replacements of cat removed, leading and trailing dots and spaces too.
+
+        Items matched by std_repl() have the same canonical form, so items with different
+        canonical forms can be rejected without trying the replacements. Artists and
+        albums repeat for many tracks, so results are cached.
+    """
+    if cat in std_canonical_patterns:
+        item = std_canonical_patterns[cat].sub('', item)
+    return remove_dots_and_spaces(item)
+
 def std_repl(cat, f_item, t_item):
     """
         Apply standard replacements:
@@ -419,30 +644,17 @@ def std_repl(cat, f_item, t_item):
             AL  Album
     """
 
-    substitutions = {
-        "AR" : {
-            ### Note: first entries for ':' and '/' are homoglyps!
-            ':' : ['∶'],
-            '/' : ['⁄'],
-            '?' : [''],
-        },
-        "AL" : {
-            ### Note: first entries for ':' and '/' are homoglyps!
-            ':' : ['∶'],
-            '/' : ['⁄'],
-            '?' : [''],
-            '>' : ['-'],
-            '=' : ['-'],
-        },
-    }
-
     if f_item == t_item:
         ### Perfect match
         return True
 
+    if std_canonical(cat, f_item) != std_canonical(cat, t_item):
+        ### No combination of replacements can match
+        return False
+
     ### Single substitution
-    if cat in substitutions:
-        subs = substitutions[cat]
+    if cat in std_substitutions:
+        subs = std_substitutions[cat]
         for i,v in enumerate(subs):
             for sub in subs[v]:
                 if f_item == t_item.replace(v, sub):
@@ -451,8 +663,8 @@ def std_repl(cat, f_item, t_item):
 
     ### Multiple substitutions
     t_item_mod = t_item
-    if cat in substitutions:
-        subs = substitutions[cat]
+    if cat in std_substitutions:
+        subs = std_substitutions[cat]
         for i,v in enumerate(subs):
             for sub in subs[v]:
                 t_item_mod = t_item_mod.replace(v, sub)
@@ -468,6 +680,47 @@ def std_repl(cat, f_item, t_item):
 
     return False
 
+def std_repl_columns(cat, f_items, t_items):
+    """
+        Column-wise std_repl() for pandas Series f_items and t_items.
+
+        Return value: boolean Series, True where std_repl() would return True.
+        Substitutions are reported as by std_repl().
+    """
+    matched = f_items == t_items
+    f_rest, t_rest = f_items[~matched], t_items[~matched]
+    subs = std_substitutions.get(cat, {})
+
+    ### Only rows with the same canonical form can match
+    same = f_rest.map(functools.partial(std_canonical, cat)) == t_rest.map(functools.partial(std_canonical, cat))
+    f_rest, t_rest = f_rest[same], t_rest[same]
+
+    ### Single substitution
+    for i,v in enumerate(subs):
+        for sub in subs[v]:
+            hit = f_rest == t_rest.str.replace(v, sub, regex=False)
+            for t_item, f_item in zip(t_rest[hit], f_rest[hit]):
+                report_substitution(f'{cat}{i}', t_item, f_item)
+            matched[hit.index[hit]] = True
+            f_rest, t_rest = f_rest[~hit], t_rest[~hit]
+
+    ### Multiple substitutions
+    t_rest_mod = t_rest
+    for i,v in enumerate(subs):
+        for sub in subs[v]:
+            t_rest_mod = t_rest_mod.str.replace(v, sub, regex=False)
+            hit = f_rest == t_rest_mod
+            for t_item_mod, f_item in zip(t_rest_mod[hit], f_rest[hit]):
+                report_substitution(f'{cat}{i*10}', t_item_mod, f_item)
+            matched[hit.index[hit]] = True
+            f_rest, t_rest_mod = f_rest[~hit], t_rest_mod[~hit]
+
+    if cat in ['AL', 'AR']:
+        hit = t_rest_mod.str.strip(' .') == f_rest
+        matched[hit.index[hit]] = True
+
+    return matched
+
 def match_album(tag, item):
     """
     (Try to) match album.
@@ -536,16 +789,10 @@ def check_cdm(str):
         For example, an 'í' can be represented as
         a) Single char   (2 bytes in UTF-8): 0xc3 0xad      -> LATIN SMALL LETTER I WITH ACUTE
         b) Composed char (3 bytes in UTF-8): 0x69 0xcc 0x81 -> LATIN SMALL LETTER I plus COMBINING ACUTE ACCENT
-    """
-    chars = [b'\xcc', b'\xcd']
 
-    ba = str.encode('utf-8')
-    for i,_ in enumerate(ba):
-        for c in chars:
-            d = (ba[i]).to_bytes(1, 'big')
-            if d == c:
-                e = ba[i-1:i+2].decode('utf-8')
-                return e
+        Return value: the mark and the character before it, None if there is no mark
+    """
+    return helpers.find_cdm(str)
 
 # Extract track number and title from filename
 # Returns either a tuple of track and title or None
@@ -561,18 +808,24 @@ def is_valid_mp3_filename(filename):
     return True if get_track_title(filename) else False
 
 
-def check_tag(tag):
+def tag_full_path(tag):
     """
-        Check file for errors or inconsistencies.
-
-        Return value: Tag entry if no errors occured; None otherwise
+        Return relative path of the file of tag, as expected from its file fields.
     """
     if tag['f_type'] == 'mp3':
-        full_path = f"{tag['f_artist']}/{tag['f_album']}/{tag['f_track']} - {tag['f_title']}.mp3"
+        return f"{tag['f_artist']}/{tag['f_album']}/{tag['f_track']} - {tag['f_title']}.mp3"
     elif tag['f_type'] == 'flac':
         # If filename does not contain title, just take the one from the tag
         title = tag['f_title'] if len(tag['f_title']) > 0 else tag['t_title']
-        full_path = f"{tag['f_artist']}/{tag['f_album']}/{tag['f_track']} - {title}.flac"
+        return f"{tag['f_artist']}/{tag['f_album']}/{tag['f_track']} - {title}.flac"
+
+def check_tag(tag):
+    """
+        Check file for errors or inconsistencies.
+
+        Return value: Tag entry if no errors occured; None otherwise
+    """
+    full_path = tag_full_path(tag)
 
     len_tracker.check_length(full_path)
 
@@ -608,10 +861,85 @@ def check_tag(tag):
         report_mismatch(full_path, "Title", tag['f_title'], tag['t_title'])
     return tag
 
-def parse_dir(top_dir, md5_fh):
-    num_files = 0
-    num_mp3 = 0
+def check_tags_bulk(tags):
+    """
+        Same checks as check_tag() for all rows of the pandas DataFrame tags, with
+        columns field_names.
 
+        Exact matches, standard replacements and length statistics are computed
+        column-wise. Only the remaining rows are checked by the matchers of
+        check_tag(), in the same order, so the same violations are reported.
+    """
+    if len(tags) == 0:
+        return
+    cols = {k : tags[k] for k in field_names}
+
+    ### Length statistics
+    title = cols['f_title'].where((cols['f_type'] != 'flac') | (cols['f_title'] != ''), cols['t_title'])
+    full_paths = cols['f_artist'] + '/' + cols['f_album'] + '/' + cols['f_track'] + ' - ' + title + '.' + cols['f_type']
+    len_tracker.check_lengths(full_paths.tolist())
+    for k in field_names:
+        len_tracker.check_column(k, cols[k].tolist())
+
+    ### Rows with combining diacritical marks
+    cdm = functools.reduce(lambda a, b: a | b, (cols[k].str.contains(helpers.cdm_pattern) for k in field_names))
+
+    unique_artists.update(cols['t_artist'])
+    unique_albums.update(cols['t_album'])
+
+    no_rows = pd.Series(False, index=tags.index)
+    track_mismatch = cols['f_track'] != cols['t_track'] if report_mismatch_flags['track'] else no_rows
+    artist_rest = ~std_repl_columns('AR', cols['f_artist'], cols['t_artist']) if report_mismatch_flags['artist'] else no_rows
+    album_artist_rest = no_rows
+    if report_mismatch_flags['album_artist']:
+        album_artist_rest = ((cols['t_artist'] != cols['t_album_artist'])
+            & ~cols['t_album_artist'].isin(['Various Artists', '']))
+    album_rest = ~std_repl_columns('AL', cols['f_album'], cols['t_album']) if report_mismatch_flags['album'] else no_rows
+    title_rest = cols['f_title'] != cols['t_title'] if report_mismatch_flags['title'] else no_rows
+
+    rest = cdm | track_mismatch | artist_rest | album_artist_rest | album_rest | title_rest
+    rest_rows = tags[rest].to_dict('records')
+    rest_paths = full_paths[rest].tolist()
+    rest_checks = zip(cdm[rest], track_mismatch[rest], artist_rest[rest], album_artist_rest[rest], album_rest[rest], title_rest[rest])
+    for tag, full_path, checks in zip(rest_rows, rest_paths, rest_checks):
+        cdm_i, track_mismatch_i, artist_i, album_artist_i, album_i, title_i = checks
+
+        if cdm_i:
+            for k,v in tag.items():
+                c = check_cdm(v)
+                if c:
+                    my_print(f'CDM {c} found: {k} in {full_path}')
+
+        if track_mismatch_i:
+            report_mismatch(full_path, "Track number", tag['f_track'], tag['t_track'])
+
+        if artist_i and not match_artist(tag):
+            report_mismatch(full_path, "Artist", tag['f_artist'], tag['t_artist'])
+
+        if album_artist_i and not match_album_artist(tag):
+            report_mismatch(full_path, "Album artist", tag['f_artist'], tag['t_album_artist'])
+
+        if album_i and not match_album(tag, 'album'):
+            report_mismatch(full_path, "Album", tag['f_album'], tag['t_album'])
+
+        if title_i and not match_title(tag, 'title'):
+            report_mismatch(full_path, "Title", tag['f_title'], tag['t_title'])
+
+def read_csv_columns(csv_file):
+    """
+        Read CSV file written by extract_tags_to_csv() into a pandas DataFrame of str.
+    """
+    return pd.read_csv(csv_file, sep='\t', quoting=csv.QUOTE_NONE, escapechar='\\', header=0,
+        names=field_names, dtype=object, na_filter=False, engine='c',
+        encoding='utf-8', encoding_errors='surrogateescape')
+
+def walk_dir(top_dir, stats):
+    """
+        Walk top_dir in sorted order and check the folder hierarchy.
+
+        Yield the full path of every file below level 2. The number of files
+        seen is counted in stats['num_files'].
+    """
     for dirpath, dirnames, filenames in os.walk(top_dir):
         dirnames.sort()
         filenames.sort()
@@ -620,7 +948,7 @@ def parse_dir(top_dir, md5_fh):
 
         ### then, iterate over files
         for fname in filenames:
-            num_files += 1
+            stats['num_files'] += 1
             p = pathlib.PurePath(dirpath)
             if len(p.parts) == 0:
                 violations.add_violation(f"violation: rule_1a: no files are allowed in level 1: {fname}")
@@ -628,24 +956,186 @@ def parse_dir(top_dir, md5_fh):
                 # TODO check whether this should not be rule_1b / level 2
                 violations.add_violation(f"violation: rule_1a: no files are allowed in level 1: {fname}")
             else:
-                _, tag = parse_file(top_dir, os.path.join(dirpath, fname), md5_fh)
-                if tag:
-                    num_mp3 += 1
-    return num_files, num_mp3
+                yield os.path.join(dirpath, fname)
+
+def parse_dir(top_dir, manifests, jobs=1):
+    stats = {'num_files' : 0}
+    num_mp3 = 0
+
+    files = walk_dir(top_dir, stats)
+
+    if jobs > 1:
+        ### Check files in walk order, hash them in parallel and write the
+        ### results in walk order again
+        to_hash = (f for f in files if check_file(top_dir, f))
+
+        def hash_func(full_path):
+            # Errors are raised in walk order, as in the serial run
+            try:
+                return manifests.hash(top_dir, full_path)
+            except OSError as e:
+                return e
+
+        for full_path, res in helpers.run_pool(hash_func, to_hash, jobs=jobs, ordered=True):
+            if isinstance(res, OSError):
+                raise res
+            manifests.write(top_dir, full_path, res)
+    else:
+        for full_path in files:
+            _, tag = parse_file(top_dir, full_path, manifests)
+            if tag:
+                num_mp3 += 1
+    return stats['num_files'], num_mp3
+
+def manifest_name(md5_file, algo, first):
+    """
+        Return file name of the manifest for algo.
+
+        The first manifest is written to md5_file itself, all others next to it,
+        with the algorithm as extension, e.g. list.md5 and list.sha256.
+    """
+    if first:
+        return md5_file
+    return f'{os.path.splitext(md5_file)[0]}.{algo}'
+
+def sidecar_name(md5_file):
+    """
+        Return file name of the sidecar holding size and mtime of the files in md5_file.
+    """
+    return f'{md5_file}.meta'
+
+class PreviousRun:
+    """
+        Digests, sizes and mtimes of the files of a previous run, read from its
+        manifests and sidecar.
+    """
+
+    def __init__(self, md5_file, digests):
+        self.md5_file = md5_file
+        self.digests = {}
+        self.stats = {}
+        self.status = {'unchanged' : 0, 'changed' : 0, 'new' : 0}
+        self.seen = set()
+
+        for i, algo in enumerate(digests):
+            fname = manifest_name(md5_file, algo, i == 0)
+            if not os.path.isfile(fname):
+                print(f'Previous manifest {fname} not found, hashing files for {algo}')
+                continue
+            digest_len = len(helpers.new_hasher(algo).hexdigest())
+            with open(fname, mode='r', encoding='utf-8', errors='surrogateescape') as f:
+                for line in f:
+                    item = helpers.split_hash_filename(line.rstrip('\n'), digest_len)
+                    if item:
+                        self.digests.setdefault(item['file'], {})[algo] = item['hash']
+
+        fname = sidecar_name(md5_file)
+        if not os.path.isfile(fname):
+            print(f'Sidecar {fname} not found, hashing all files')
+            return
+        with open(fname, mode='r', encoding='utf-8', errors='surrogateescape') as f:
+            for line in f:
+                size, mtime_ns, path_rel = line.rstrip('\n').split(' ', 2)
+                self.stats[path_rel[1:]] = (int(size), int(mtime_ns))
+
+    def lookup(self, path_rel, st, algos):
+        """
+            Return digests of the previous run if the file is unchanged, None otherwise.
+        """
+        if self.stats.get(path_rel) != (st.st_size, st.st_mtime_ns):
+            return None
+        digests = self.digests.get(path_rel, {})
+        if all(algo in digests for algo in algos):
+            return digests
+        return None
+
+    def mark(self, path_rel, st):
+        """
+            Record that path_rel was found in this run.
+        """
+        self.seen.add(path_rel)
+        if path_rel not in self.digests:
+            self.status['new'] += 1
+        elif self.stats.get(path_rel) == (st.st_size, st.st_mtime_ns):
+            self.status['unchanged'] += 1
+        else:
+            self.status['changed'] += 1
+
+    def report(self):
+        removed = sorted(set(self.digests) - self.seen)
+        print(f'Incremental run against {self.md5_file}: {self.status['unchanged']} unchanged, '
+              f'{self.status['changed']} changed, {self.status['new']} new, {len(removed)} removed file(s)')
+        for path_rel in removed:
+            print(f'removed: {path_rel}')
+
+class Manifests:
+    """
+        Write digests of files to one manifest per hash algorithm (or to stdout),
+        plus a sidecar holding size and mtime of every file for incremental runs.
+    """
+
+    def __init__(self, md5_file, digests, previous=None):
+        self.algos = list(digests)
+        self.fhs = {}
+        self.sidecar_fh = None
+        self.previous = previous
+
+        if md5_file:
+            for i, algo in enumerate(self.algos):
+                self.fhs[algo] = open(manifest_name(md5_file, algo, i == 0), mode='w+', encoding='utf-8')
+            self.sidecar_fh = open(sidecar_name(md5_file), mode='w+', encoding='utf-8', errors='surrogateescape')
+
+    def hash(self, top_dir, full_path):
+        """
+            Return digests and stat result of a file. Digests of unchanged files
+            are taken from the previous run, if any.
+        """
+        st = os.stat(full_path)
+        digests = None
+        if self.previous:
+            path_rel = str(pathlib.PurePath(full_path).relative_to(top_dir))
+            digests = self.previous.lookup(path_rel, st, self.algos)
+        if digests is None:
+            digests = helpers.file_digests(full_path, self.algos)
+        return digests, st
+
+    def write(self, top_dir, full_path, res):
+        digests, st = res
+        path_rel = pathlib.PurePath(full_path).relative_to(top_dir)
+        for algo in self.algos:
+            line = f'{digests[algo]}  {path_rel}\n'
+            if algo in self.fhs:
+                self.fhs[algo].write(line)
+            else:
+                print(line, end='')
+        if self.sidecar_fh:
+            self.sidecar_fh.write(f'{st.st_size} {st.st_mtime_ns}  {path_rel}\n')
+        if self.previous:
+            self.previous.mark(str(path_rel), st)
+
+    def close(self, report):
+        for fh in self.fhs.values():
+            fh.write(report)
+            fh.close()
+        if self.sidecar_fh:
+            self.sidecar_fh.close()
 
 # Generate report.
 # Depending on the options chosen, either MD5 hashes are calculated, CSV entries
 # are generated, or both
+# If several digests are requested, one manifest per digest is written, reading
+# every file only once.
+# If previous_md5_file is given, only new or changed files are hashed, the digests
+# of all others are taken from the previous run.
 # This function returns the number of violations for testability
-def generate_list(top_dir, md5_file=None):
+def generate_list(top_dir, md5_file=None, jobs=1, digests=('md5',), previous_md5_file=None):
 
-    md5_fh = None
+    previous = PreviousRun(previous_md5_file, digests) if previous_md5_file else None
 
-    ### Open MD5 file
-    if md5_file:
-        md5_fh = open(md5_file, mode='w+', encoding='utf-8')
+    ### Open MD5 file(s)
+    manifests = Manifests(md5_file, digests, previous)
 
-    num_files, num_mp3 = parse_dir(str(pathlib.PurePath(top_dir)), md5_fh)
+    num_files, num_mp3 = parse_dir(str(pathlib.PurePath(top_dir)), manifests, jobs=jobs)
 
     report = f'''-------------------------------------------------------------\n
         Top folder: {top_dir}\n
@@ -654,22 +1144,39 @@ def generate_list(top_dir, md5_file=None):
         {violations.get_violation_cnt()} violation(s) found\n'''
 
     violations.report_violations()
+    if previous:
+        previous.report()
 
-    if md5_file:
-        md5_fh.write(report)
-    if md5_file:
-        md5_fh.close()
+    manifests.close(report)
 
     return violations.get_violation_cnt()
 
-def analyse_csv(csv_file):
-    ### Open and parse CSV file
-    with open(csv_file, mode='r', encoding='utf-8', errors='surrogateescape') as f:
-        reader = csv.DictReader(f, fieldnames=field_names, dialect='mp3_csv')
-        for row in reader:
-            if reader.line_num > 1:
-                print(row)
-                check_tag(row)
+def analyse_csv(csv_file, bulk=False):
+    """
+        Check all rows of csv_file and report violations and statistics.
+
+        With bulk=True, the file is loaded with pandas and checked column-wise by
+        check_tags_bulk(). The rows are not printed in this mode.
+    """
+    if bulk and pd is None:
+        print('pandas not available, analysing CSV file row by row')
+        bulk = False
+    if bulk:
+        tags = read_csv_columns(csv_file)
+        if not tags['f_type'].isin(['mp3', 'flac']).all():
+            print('Unknown file types found, analysing CSV file row by row')
+            bulk = False
+
+    if bulk:
+        check_tags_bulk(tags)
+    else:
+        ### Open and parse CSV file
+        with open(csv_file, mode='r', encoding='utf-8', errors='surrogateescape') as f:
+            reader = csv.DictReader(f, fieldnames=field_names, dialect='mp3_csv')
+            for row in reader:
+                if reader.line_num > 1:
+                    print(row)
+                    check_tag(row)
 
     ### Dump unique artists to file
     with open(unique_artists_file, "w", encoding='utf8') as f:
@@ -700,7 +1207,7 @@ def analyse_csv(csv_file):
     my_print(f'  File: {len(len_tracker.stats_max['f_title']):3d}   {len_tracker.stats_max['f_title']}')
 
 def main():
-    global uni_stdout
+    global uni_stdout, uni_stderr
 
     ### Register dialect
     csv.register_dialect('mp3_csv', delimiter='\t', quoting=csv.QUOTE_NONE, escapechar='\\')
@@ -709,6 +1216,7 @@ def main():
     ### Note:   These problems may be only present when running the script locally and work flawless
     ###         over SSH.
     uni_stdout = open(1, 'w', encoding='utf-8', closefd=False)
+    uni_stderr = open(2, 'w', encoding='utf-8', closefd=False, buffering=1)
 
     parser = argparse.ArgumentParser(
 
@@ -720,6 +1228,25 @@ def main():
         -e DIR CSV_FILE           Extract MP3 tags starting from DIR and dump them to CSV_FILE.
         -c DIR MD5_FILE CSV_FILE  Combines options -m and -e.
         -a CSV_FILE               Analyse CSV file.
+        --jobs N                  Use N parallel workers for hashing (options -m and -c) and
+                                  N processes for extracting tags (options -e and -c).
+        --digests ALGO[,ALGO...]  Hash algorithms for options -m and -c, default: md5.
+                                  MD5_FILE receives the first one, the others are written
+                                  next to it with the algorithm as extension, e.g. list.sha256.
+                                  Supported: md5, sha1, sha256, sha512, blake2b, crc32.
+        --incremental PREV_FILE   Only hash files which are new or changed since the run which
+                                  wrote PREV_FILE (options -m and -c). Size and mtime of the files
+                                  are taken from the sidecar PREV_FILE.meta.
+        --no-cache                Do not use the hash cache.
+        --verify-cache            Re-hash all files and verify the hash cache.
+        --no-tag-cache            Read the tags of all files instead of using the tag cache
+                                  (options -e and -c).
+        --resume                  Continue an interrupted export to CSV_FILE from its last
+                                  checkpoint (options -e and -c).
+        --catalog                 Write the tags to CSV_FILE as SQLite tag catalog instead of
+                                  CSV, with indexes on artist, album and track (options -e and -c).
+        --bulk                    Check CSV_FILE column-wise using pandas, without printing
+                                  every row (option -a).
         """
     )
 
@@ -730,21 +1257,50 @@ def main():
     group.add_argument('-e', nargs=2, help='Extract MP3 tags starting from DIR and dump tags to CSV_FILE.')
     group.add_argument('-c', nargs=3, help='Combines options -m and -e.')
     group.add_argument('-a', nargs=1, help='Analyse CSV file.')
+    parser.add_argument('--jobs', type=int, default=1, metavar='N', help='Number of parallel workers.')
+    parser.add_argument('--digests', default='md5', metavar='ALGO[,ALGO...]', help='Hash algorithms for MD5 files.')
+    parser.add_argument('--incremental', metavar='PREV_FILE', help='MD5 file of a previous run.')
+    parser.add_argument('--resume', action='store_true', help='Continue an interrupted export to CSV_FILE.')
+    parser.add_argument('--catalog', action='store_true', help='Write tags to an SQLite catalog instead of CSV.')
+    parser.add_argument('--bulk', action='store_true', help='Analyse CSV file column-wise using pandas.')
+    helpers.add_hash_cache_args(parser)
+    extract_tags.add_tag_cache_args(parser)
     args = parser.parse_args()
+    helpers.set_hash_cache_args(args)
+    extract_tags.set_tag_cache_args(args)
+    export_tags = extract_tags_to_catalog if args.catalog else extract_tags_to_csv
+
+    digests = args.digests.split(',')
+    for algo in digests:
+        try:
+            # Only algorithms with a fixed digest length, i.e. not shake_128/shake_256
+            helpers.new_hasher(algo).hexdigest()
+        except (ValueError, TypeError):
+            parser.error(f'unsupported hash algorithm: {algo}')
+    if len(set(digests)) != len(digests):
+        parser.error('--digests must not contain an algorithm twice')
+    if len(digests) > 1 and args.m and len(args.m) != 2:
+        parser.error('--digests with several algorithms requires MD5_FILE')
+    if args.m and len(args.m) == 2:
+        md5_file = args.m[1]
+    elif args.c:
+        md5_file = args.c[1]
+    else:
+        md5_file = None
+    if md5_file:
+        names = [manifest_name(md5_file, algo, i == 0) for i, algo in enumerate(digests)]
+        if len(set(names)) != len(names):
+            parser.error(f'--digests: manifests of several algorithms would be written to the same file, rename {md5_file}')
 
     if args.m and (1 <= len(args.m) <= 2):
-        if len(args.m) == 2:
-            md5_file = args.m[1]
-        else:
-            md5_file = None
-        generate_list(args.m[0], md5_file=md5_file)
+        generate_list(args.m[0], md5_file=md5_file, jobs=args.jobs, digests=digests, previous_md5_file=args.incremental)
     elif args.e:
-        extract_tags_to_csv(args.e[0], csv_file=args.e[1])
+        export_tags(args.e[0], args.e[1], jobs=args.jobs, resume=args.resume)
     elif args.c:
-        generate_list(args.c[0], md5_file=args.c[1])
-        extract_tags_to_csv(args.c[0], csv_file=args.c[2])
+        generate_list(args.c[0], md5_file=md5_file, jobs=args.jobs, digests=digests, previous_md5_file=args.incremental)
+        export_tags(args.c[0], args.c[2], jobs=args.jobs, resume=args.resume)
     elif args.a:
-        analyse_csv(args.a[0])
+        analyse_csv(args.a[0], bulk=args.bulk)
 
     sys.exit(0)
 
@@ -1,7 +1,16 @@
 #!/usr/bin/python3
 
+import os
+import csv
+import pytest
+from unittest import mock
+from mutagen.id3 import TIT2, TPE1, TALB, TRCK
 from pyfakefs.fake_filesystem_unittest import TestCase
 import mp3_hier_checker_v5 as hc 
+from mp3_fixtures import write_mp3
+
+### Dialect of the CSV files, registered by main()
+csv.register_dialect('mp3_csv', delimiter='\t', quoting=csv.QUOTE_NONE, escapechar='\\')
 
 def test_is_valid_mp3_filename():
     assert hc.is_valid_mp3_filename("01 - Test_Song.mp3") == True
@@ -28,9 +37,27 @@ def test_remove_dots_and_spaces():
     assert hc.remove_dots_and_spaces(". Test .") == "Test"
     assert hc.remove_dots_and_spaces("Test. .") == "Test"
 
+def test_std_repl():
+    hc.enable_report_substitutions = True
+    assert hc.std_repl('AR', 'A∶B', 'A:B')
+    assert hc.std_repl('AR', 'A∶B⁄C', 'A:B/C')
+    assert hc.std_repl('AL', 'Why', 'Why?...')
+    assert hc.std_repl('AL', 'X-Y', 'X>Y')
+    assert not hc.std_repl('AL', 'X-Y', 'X:Y')
+    assert not hc.std_repl('AR', 'A:B', 'A∶B')
+    assert not hc.std_repl('AR', 'AB', 'A B')
+    assert 'Replaced AR10: A∶B⁄C with A∶B⁄C' in hc.substitutions_done
+
+    # Matching items must have the same canonical form
+    for cat, f_item, t_item in [('AR', 'A∶B', 'A:B'), ('AL', 'Why', ' Why?.'), ('AL', 'X-Y-Z', 'X>Y=Z')]:
+        assert hc.std_canonical(cat, f_item) == hc.std_canonical(cat, t_item)
+    assert hc.std_canonical('AR', 'A:B') != hc.std_canonical('AR', 'A B')
+
 class HelpersTest(TestCase):
     def setUp(self):
         self.setUpPyfakefs()
+        self.enterContext(mock.patch.object(hc.helpers.hash_cache_usage, 'mode', 'off'))
+        self.enterContext(mock.patch.object(hc.ViolationCounter, '_violations', []))
 
     def test_generate_list(self):
         # create fake files
@@ -49,3 +76,188 @@ class HelpersTest(TestCase):
         # pyfakefs will create a folder ./tmp which will trigger one violation
         self.assertEqual(num_vio, 6)
         
+
+    def test_generate_list_jobs(self):
+        # create fake files
+        for artist in ['Artist_A', 'Artist_B']:
+            for album in ['Album_A', 'Album_B']:
+                for track in range(1, 6):
+                    self.fs.create_file(f'./lib/{artist}/{album}/{track:02} - Song.mp3', contents=f'{artist}{album}{track}')
+        self.fs.create_file('./lib/Artist_B/Album_A/02 Song.mp3')   # misnamed track
+
+        # Parallel hashing must write the same MD5 lines as the serial run
+        hc.generate_list("./lib", md5_file='serial.md5')
+        hc.generate_list("./lib", md5_file='parallel.md5', jobs=4)
+        with open('serial.md5') as f:
+            serial = [l for l in f if l.endswith('.mp3\n')]
+        with open('parallel.md5') as f:
+            parallel = [l for l in f if l.endswith('.mp3\n')]
+        self.assertEqual(len(serial), 20)
+        self.assertEqual(serial, parallel)
+
+    def test_generate_list_read_error(self):
+        for track in range(1, 6):
+            self.fs.create_file(f'./lib/Artist_A/Album_A/{track:02} - Song.mp3', contents=str(track))
+        file_digests = hc.helpers.file_digests
+
+        def failing_digests(path, algos):
+            if path.endswith('03 - Song.mp3'):
+                raise PermissionError(13, 'Permission denied', path)
+            return file_digests(path, algos)
+
+        # A file which can't be read aborts the run in both modes
+        self.enterContext(mock.patch.object(hc.helpers, 'file_digests', failing_digests))
+        for jobs in [1, 4]:
+            with self.subTest(jobs=jobs), self.assertRaises(PermissionError):
+                hc.generate_list("./lib", md5_file=f'list{jobs}.md5', jobs=jobs)
+
+    def test_generate_list_incremental(self):
+        # create fake files
+        for album in ['Album_A', 'Album_B']:
+            for track in range(1, 4):
+                self.fs.create_file(f'./lib/Artist_A/{album}/{track:02} - Song.mp3', contents=f'{album}{track}')
+
+        hc.generate_list("./lib", md5_file='run1.md5')
+
+        # Change, add and remove a file
+        with open('./lib/Artist_A/Album_A/01 - Song.mp3', 'a') as f:
+            f.write('changed')
+        self.fs.create_file('./lib/Artist_A/Album_B/04 - Song.mp3', contents='new')
+        os.remove('./lib/Artist_A/Album_B/01 - Song.mp3')
+
+        # Incremental run must write the same MD5 lines as a full run
+        hc.generate_list("./lib", md5_file='run2.md5', previous_md5_file='run1.md5')
+        hc.generate_list("./lib", md5_file='full.md5')
+        with open('run2.md5') as f:
+            incremental = [l for l in f if l.endswith('.mp3\n')]
+        with open('full.md5') as f:
+            full = [l for l in f if l.endswith('.mp3\n')]
+        self.assertEqual(len(full), 6)
+        self.assertEqual(incremental, full)
+
+@pytest.fixture
+def mp3_lib(tmp_path, monkeypatch):
+    '''Library of 10 tagged MP3 files in two albums, with the tag cache disabled.'''
+    monkeypatch.setattr(hc.extract_tags.tag_cache_usage, 'mode', 'off')
+    for album in ['Album_A', 'Album_B']:
+        for track in [1, 2, 3, 10, 11]:
+            write_mp3(tmp_path / 'lib' / 'Artist_A' / album / f'{track:02} - Song.mp3', [
+                TPE1(encoding=3, text=['Artist']),
+                TALB(encoding=3, text=[album]),
+                TIT2(encoding=3, text=[f'Song {track}']),
+                TRCK(encoding=3, text=[str(track)]),
+            ])
+    return tmp_path / 'lib'
+
+def test_iter_file_infos_jobs(mp3_lib, monkeypatch):
+    files = hc.collect_tag_files(str(mp3_lib))
+    serial = [fi.fields() for fi in hc.iter_file_infos(files)]
+
+    # Every other file is in the tag cache, the others are read by the worker processes
+    cache = hc.extract_tags.tag_cache.TagCache('v1', ':memory:')
+    monkeypatch.setattr(hc.extract_tags.tag_cache_usage, 'mode', 'on')
+    monkeypatch.setattr(hc.extract_tags.tag_cache_usage, '_cache', cache)
+    list(hc.iter_file_infos(files[::2]))
+    assert len(cache) == 5
+
+    parallel = list(hc.iter_file_infos(files, jobs=2))
+    assert [fi.file_name for fi in parallel] == files
+    assert [fi.fields() for fi in parallel] == serial
+    assert len(cache) == 10
+
+def test_extract_tags_to_csv_resume(mp3_lib, tmp_path, monkeypatch):
+    lib = str(mp3_lib)
+    full_csv = tmp_path / 'full.csv'
+    hc.extract_tags_to_csv(lib, str(full_csv))
+    assert not os.path.exists(hc.journal_name(str(full_csv)))
+
+    # Interrupt the export after 7 files, the last checkpoint is after 6 files
+    monkeypatch.setattr(hc, 'CSV_BATCH_SIZE', 3)
+    get_file_info = hc.extract_tags.get_file_info
+    num_calls = 0
+    def failing_get_file_info(full_path):
+        nonlocal num_calls
+        num_calls += 1
+        if num_calls > 7:
+            raise KeyboardInterrupt
+        return get_file_info(full_path)
+    monkeypatch.setattr(hc.extract_tags, 'get_file_info', failing_get_file_info)
+    part_csv = tmp_path / 'part.csv'
+    with pytest.raises(KeyboardInterrupt):
+        hc.extract_tags_to_csv(lib, str(part_csv))
+    assert hc.read_journal(str(part_csv))[1:] == (6, part_csv.stat().st_size)
+
+    # Resuming reads only the remaining files
+    num_calls = -100
+    hc.extract_tags_to_csv(lib, str(part_csv), resume=True)
+    assert num_calls == -96
+    assert part_csv.read_text(encoding='utf-8') == full_csv.read_text(encoding='utf-8')
+    assert not os.path.exists(hc.journal_name(str(part_csv)))
+
+def test_extract_tags_to_catalog(mp3_lib, tmp_path):
+    db_file = str(tmp_path / 'tags.sqlite')
+    hc.extract_tags_to_catalog(str(mp3_lib), db_file)
+    hc.extract_tags_to_catalog(str(mp3_lib), db_file, resume=True)
+
+    with hc.extract_tags.open_tag_catalog(db_file) as catalog:
+        assert catalog.columns == hc.field_names
+        assert len(catalog) == 10
+        # Sorted by track number, not by text
+        found = hc.extract_tags.find_file_infos(catalog, t_artist='Artist', t_album='Album_B')
+        assert [fi['t_track'] for fi in found] == ['1', '2', '3', '10', '11']
+        assert found[0].file_name == str(mp3_lib / 'Artist_A' / 'Album_B' / '01 - Song.mp3')
+        assert found[0]['f_title'] == 'Song'
+
+def test_extract_tags_to_api_catalog(mp3_lib, tmp_path):
+    # A catalog created with all fields can be written by the export
+    db_file = str(tmp_path / 'tags.sqlite')
+    hc.extract_tags.open_tag_catalog(db_file, hc.extract_tags.CATALOG_FIELDS).close()
+    hc.extract_tags_to_catalog(str(mp3_lib), db_file)
+
+    with hc.extract_tags.open_tag_catalog(db_file) as catalog:
+        assert catalog.columns == hc.extract_tags.CATALOG_FIELDS
+        found = hc.extract_tags.find_file_infos(catalog, t_album='Album_A', t_track='10')
+        assert [fi['t_artist'] for fi in found] == ['Artist']
+
+def analyse_state(monkeypatch, csv_file, bulk):
+    monkeypatch.setattr(hc.ViolationCounter, '_violations', [])
+    monkeypatch.setattr(hc, 'substitutions_done', set())
+    monkeypatch.setattr(hc, 'unique_artists', set())
+    monkeypatch.setattr(hc, 'unique_albums', set())
+    monkeypatch.setattr(hc.LengthTracker, 'stats_max', {f : None for f in hc.field_names})
+    monkeypatch.setattr(hc.LengthTracker, 'stats_min', {f : None for f in hc.field_names})
+    monkeypatch.setattr(hc.LengthTracker, 'file_longest', '')
+    monkeypatch.setattr(hc.LengthTracker, 'file_shortest', '')
+    printed = []
+    monkeypatch.setattr(hc, 'my_print', printed.append)
+    monkeypatch.chdir(csv_file.parent)
+    hc.analyse_csv(str(csv_file), bulk=bulk)
+    return (hc.violations._violations, hc.substitutions_done, hc.unique_artists, hc.unique_albums,
+        hc.len_tracker.stats_max, hc.len_tracker.stats_min, hc.len_tracker.file_longest, hc.len_tracker.file_shortest, printed)
+
+@pytest.mark.skipif(hc.pd is None, reason='pandas not installed')
+def test_analyse_csv_bulk(tmp_path, monkeypatch):
+    rows = [
+        # f_artist, f_album, f_title, f_track, f_type, t_artist, t_album_artist, t_album, t_title, t_track
+        ['A', 'B', 'Song', '01', 'mp3', 'A', 'A', 'B', 'Song', '1'],
+        ['A', 'B', 'Song 2', '02', 'mp3', 'A', '', 'B', 'Song 2', '02'],
+        ['A∶B', 'X∶Y', 'T', '03', 'mp3', 'A:B', 'Various Artists', 'X:Y', 'T', '03'],
+        ['A', 'X-Y-Z', 'T', '04', 'mp3', 'A', 'C', 'X>Y=Z', 'T', '04'],
+        ['A', 'Why', 'T', '05', 'flac', 'A.', 'A', 'Why?', '', '05'],
+        ['A', 'B', '', '06', 'flac', 'A', 'A', 'B', 'Title from tag', '06'],
+        ['Bahntier', 'B', 'T', '07', 'mp3', ':Bahntier//', 'A', 'B', 'T\tab', '07'],
+        ['Café', 'B', 'T', '08', 'mp3', 'Café', 'Café', 'B\\', 'T "q"', '08'],
+        ['', '', '', '', 'mp3', '', '', '', '', ''],
+        ['Long artist name', 'B', 'T', '09', 'mp3', 'Other', 'Long artist name', 'C', 'T', '09'],
+    ]
+    csv_file = tmp_path / 'tags.csv'
+    with open(csv_file, 'w', encoding='utf-8') as f:
+        writer = csv.writer(f, dialect='mp3_csv')
+        writer.writerow(hc.field_names)
+        writer.writerows(rows)
+
+    row_state = analyse_state(monkeypatch, csv_file, bulk=False)
+    bulk_state = analyse_state(monkeypatch, csv_file, bulk=True)
+    assert len(row_state[0]) == 9
+    assert row_state[1] and row_state[8]
+    assert bulk_state == row_state
@@ -11,8 +11,8 @@ from mutagen.flac import FLAC
 # Todo
 #
 # Write function to extract tags from CSV file instead of a file.
-# Then, provide functions to identify file info instances based on search criteria
-# like Album, Artist, Track number etc.
+# FileInfo instances can be looked up by Album, Artist, Track number etc. in a tag
+# catalog written by mp3_hier_checker_v5.py -e --catalog, see extract_tags.find_file_infos.
 
 # custom modules
 mod_path = pathlib.Path(__file__).resolve().parents[1]/'helpers'
@@ -61,8 +61,8 @@ def transfer_tags(mp3_path, flac_path, dry_run=False, verbose=False):
         print(f"Error reading {mp3_path}: {e}")
         return
 
-    mp3_file = extract_tags.FileInfo(mp3_path)
-    flac_file = extract_tags.FileInfo(flac_path)
+    mp3_file = extract_tags.get_file_info(mp3_path)
+    flac_file = extract_tags.get_file_info(flac_path)
 
     print(f"Transferring tags\nfrom: {mp3_path}\nto:   {flac_path}")
     flac_size, flac_md5 = helpers.file_size(flac_path), helpers.file_md5(flac_path)
@@ -201,8 +201,12 @@ if __name__ == "__main__":
     parser.add_argument('-v', action='store_true', help='Verbose logging.')
     parser.add_argument('mp3_dir', help='MP3 folder.')
     parser.add_argument('flac_dir', help='FLAC folder.')
+    helpers.add_hash_cache_args(parser)
+    extract_tags.add_tag_cache_args(parser)
 
     args = parser.parse_args()
+    helpers.set_hash_cache_args(args)
+    extract_tags.set_tag_cache_args(args)
 
     if not os.path.isdir(args.mp3_dir) or not os.path.isdir(args.flac_dir):
         print("Both arguments must be directories.")
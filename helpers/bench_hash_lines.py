@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+
+# Benchmark parsing of MD5 lists: split_hash_filename per line versus parse_hash_lines in bulk.
+# The former implementation of split_hash_filename, compiling its pattern on every call, is
+# included as reference.
+#
+# Usage: bench_hash_lines.py [NUM_LINES]    (default: 1000000, e.g. 10000000 for a full NAS list)
+
+import sys
+import re
+import time
+import random
+import helpers
+
+def split_hash_filename_old(line):
+    pattern = re.compile(r"([0-9a-f]{32})(\s+\**)(.*)")
+    m = re.search(pattern, line)
+    if m:
+        d = dict()
+        d['hash'] = m.group(1)
+        d['ws'] = m.group(2)
+        d['file'] = m.group(3)
+        return d
+
+def make_lines(num):
+    rnd = random.Random(0)
+    lines = []
+    for i in range(num):
+        sep = rnd.choice(['  ', ' *', '  *'])
+        lines.append(f'{rnd.getrandbits(128):032x}{sep}./Artist {i % 1000}/Album {i % 97}/{i:02} - Track {i}.mp3')
+    return lines
+
+if __name__ == '__main__':
+    num = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    lines = make_lines(num)
+
+    t0 = time.perf_counter()
+    items = [split_hash_filename_old(l) for l in lines]
+    t1 = time.perf_counter()
+    items = [helpers.split_hash_filename(l) for l in lines]
+    t2 = time.perf_counter()
+    cols = helpers.parse_hash_lines(lines)
+    t3 = time.perf_counter()
+
+    assert len(cols) == len(items) == num
+    print(f'{num} lines')
+    print(f'split_hash_filename (old): {t1 - t0:7.2f} s')
+    print(f'split_hash_filename:       {t2 - t1:7.2f} s')
+    print(f'parse_hash_lines:          {t3 - t2:7.2f} s  (speedup {(t1 - t0) / (t3 - t2):.1f}x / {(t2 - t1) / (t3 - t2):.1f}x)')
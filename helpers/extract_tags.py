@@ -5,9 +5,18 @@ import os
 import re
 import sys
 import pathlib
-from mutagen.id3 import ID3
+import hashlib
+from mutagen.id3 import ID3, TCON, ID3TimeStamp
 from mutagen.flac import FLAC
 from mutagen import MutagenError
+import sqlite_cache
+import tag_cache
+import tag_catalog
+
+### Usage of the persistent tag cache (tag_cache_usage.mode):
+###   'on'      look up tags in the cache, read and store files not found
+###   'off'     don't use the cache at all (--no-tag-cache)
+tag_cache_usage = sqlite_cache.CacheUsage('Tag cache', lambda: tag_cache.TagCache(tag_fingerprint()))
 
 # Mapping from ID3 frame to Vorbis comment field
 #    "TPOS": "discnumber",
@@ -17,10 +26,194 @@ from mutagen import MutagenError
 #    "COMM": "comment",
 #    "COMM::eng": "comment",
 
+### ID3v2 fast path: text frames are read directly from the tag, all other frames
+### (e.g. cover art in APIC frames) are skipped without reading them.
+_ID3_FRAME_ID = re.compile(rb'[A-Z0-9]{4}')
+_ID3_ENCODINGS = {
+    0 : ('latin-1', b'\x00'),
+    1 : ('utf-16', b'\x00\x00'),
+    2 : ('utf-16-be', b'\x00\x00'),
+    3 : ('utf-8', b'\x00'),
+}
+_ID3_YEAR = re.compile(r'([0-9]{4})(-[0-9]{2}-[0-9]{2})?\Z')
+
+class _UnusualTag(Exception):
+    '''Tag needs to be read by mutagen.'''
+
+def _syncsafe(data):
+    value = 0
+    for b in data:
+        if b & 0x80:
+            raise _UnusualTag()
+        value = (value << 7) | b
+    return value
+
+def _find_terminator(data, term):
+    i = data.find(term)
+    # UTF-16 terminators must be aligned
+    while len(term) == 2 and i >= 0 and i % 2:
+        i = data.find(term, i + 1)
+    return i
+
+def _decode_id3_text(data, v24):
+    '''Decode text frame data into a list of values, as mutagen does.'''
+    if not data or data[0] not in _ID3_ENCODINGS:
+        raise _UnusualTag()
+    codec, term = _ID3_ENCODINGS[data[0]]
+    data = data[1:]
+    values = []
+    try:
+        while data:
+            i = _find_terminator(data, term)
+            value, data = (data, b'') if i < 0 else (data[:i], data[i + len(term):])
+            if codec == 'utf-16' and value and value[:2] not in (b'\xff\xfe', b'\xfe\xff'):
+                raise _UnusualTag()
+            values.append(value.decode(codec))
+            # Zero padding after the last value of an old tag is not another value
+            if not v24 and not data.strip(b'\x00'):
+                data = b''
+    except UnicodeDecodeError:
+        raise _UnusualTag()
+    return values
+
+def read_id3_text_frames(file, frame_ids):
+    '''Read text frames frame_ids from the ID3v2 tag of file.
+
+    Only the tag header and the frame headers are read, other frames are
+    skipped. Return dict {frame id : text}, text is the same as str() of the
+    mutagen frame (after mutagen's conversion to ID3v2.4, e.g. TYER to TDRC).
+    Return None for anything not handled here, e.g. ID3v2.2, unsynchronisation,
+    compressed frames or an additional ID3v1 tag, use mutagen then.
+    '''
+    frames = {}
+    try:
+        with open(file, 'rb') as fh:
+            header = fh.read(10)
+            if len(header) < 10 or header[:3] != b'ID3' or header[3] not in (3, 4) or header[5] & 0xc0:
+                raise _UnusualTag()
+            v24 = header[3] == 4
+            end = 10 + _syncsafe(header[6:10])
+            wanted = set(frame_ids) if v24 else set(frame_ids) | {'TYER', 'TDAT', 'TIME'}
+
+            pos = 10
+            while pos + 10 <= end:
+                fh.seek(pos)
+                frame_header = fh.read(10)
+                if len(frame_header) < 10:
+                    raise _UnusualTag()
+                frame_id = frame_header[:4]
+                if frame_id.strip(b'\x00') == b'':
+                    # Padding
+                    break
+                if not _ID3_FRAME_ID.fullmatch(frame_id):
+                    raise _UnusualTag()
+                size = _syncsafe(frame_header[4:8]) if v24 else int.from_bytes(frame_header[4:8], 'big')
+                pos += 10 + size
+                if pos > end:
+                    raise _UnusualTag()
+
+                frame_id = frame_id.decode('ascii')
+                if frame_id not in wanted or size == 0:
+                    continue
+                # Compression, encryption, grouping, unsynchronisation, data length
+                if frame_header[9] & (0x4f if v24 else 0xe0) or frame_id in frames:
+                    raise _UnusualTag()
+                data = fh.read(size)
+                if len(data) < size:
+                    raise _UnusualTag()
+                frames[frame_id] = _decode_id3_text(data, v24)
+
+            # mutagen adds frames from an ID3v1 tag at the end of the file
+            fh.seek(max(0, fh.seek(0, os.SEEK_END) - 131))
+            if b'TAG' in fh.read():
+                raise _UnusualTag()
+    except (_UnusualTag, OSError):
+        return None
+
+    if not v24:
+        if 'TDAT' in frames or 'TIME' in frames:
+            return None
+        tyer = frames.pop('TYER', [])
+        if 'TDRC' not in frames:
+            stamps = [''.join(m.groups('')) for m in map(_ID3_YEAR.match, tyer) if m]
+            if stamps:
+                frames['TDRC'] = stamps
 
+    text = {}
+    for frame_id, values in frames.items():
+        if frame_id == 'TCON':
+            # Resolve '(17)' and other numeric genres like mutagen
+            values = TCON(encoding=3, text=values).genres
+        elif frame_id == 'TDRC':
+            text[frame_id] = ','.join(ID3TimeStamp(v).text for v in values)
+            continue
+        text[frame_id] = '\x00'.join(values)
+    return text
+
+### FLAC fast path: the metadata block headers are walked until the VORBIS_COMMENT
+### block, other blocks (e.g. pictures and seek tables) are skipped.
+FLAC_STREAMINFO = 0
+FLAC_VORBIS_COMMENT = 4
+
+def _parse_vorbis_comment(data):
+    '''Parse a FLAC VORBIS_COMMENT block as mutagen does, return dict
+    {lower-case field name : list of values}.'''
+    def uint32(pos):
+        if pos + 4 > len(data):
+            raise _UnusualTag()
+        return int.from_bytes(data[pos : pos + 4], 'little')
+
+    comments = {}
+    pos = 4 + uint32(0)
+    count = uint32(pos)
+    pos += 4
+    for i in range(count):
+        length = uint32(pos)
+        pos += 4
+        if pos + length > len(data):
+            raise _UnusualTag()
+        string = data[pos : pos + length].decode('utf-8', 'replace')
+        pos += length
+        key, sep, value = string.partition('=')
+        if not sep:
+            key, value = f'unknown{i}', string
+        key = key.encode('ascii', 'replace').decode('ascii').lower()
+        if all(' ' <= c <= '}' and c != '=' for c in key):
+            comments.setdefault(key, []).append(value)
+    return comments
+
+def read_flac_comments(file):
+    '''Read the Vorbis comments of a FLAC file.
+
+    Only the metadata block headers and the VORBIS_COMMENT block are read,
+    reading stops after the latter. Return dict {lower-case field name : list
+    of values}, or None for anything not handled here (e.g. an ID3 tag in
+    front of the FLAC stream or a broken block), use mutagen then.
+    '''
+    try:
+        with open(file, 'rb') as fh:
+            header = fh.read(8)
+            # The first block must be STREAMINFO
+            if len(header) < 8 or header[:4] != b'fLaC' or header[4] & 0x7f != FLAC_STREAMINFO \
+                    or int.from_bytes(header[5:8], 'big') != 34:
+                raise _UnusualTag()
+            pos = 8 + 34
+            last = header[4] & 0x80
+            while not last:
+                fh.seek(pos)
+                block_header = fh.read(4)
+                if len(block_header) < 4:
+                    raise _UnusualTag()
+                last = block_header[0] & 0x80
+                size = int.from_bytes(block_header[1:4], 'big')
+                if block_header[0] & 0x7f == FLAC_VORBIS_COMMENT:
+                    return _parse_vorbis_comment(fh.read(size))
+                pos += 4 + size
+            return {}
+    except (_UnusualTag, OSError):
+        return None
 
 class FileInfo():
-    file_name = ''
     # Tags from ID3 or Vorbis meta data
     t_tags = {
         't_track'        : { 'id3' : 'TRCK', 'vorbis' : 'tracknumber'},
@@ -38,11 +231,34 @@ class FileInfo():
         'f_title',
         'f_track'
     }
+    # Fields shared by many files (e.g. all tracks of an album), their values are interned
+    shared_fields = {'f_artist', 'f_album', 'f_type', 't_artist', 't_album_artist', 't_album', 't_date', 't_genre'}
+    sort_fields = ('t_artist', 't_album', 't_track')
+
+    # All values are stored as str. Other keys than the ones above (e.g. Vorbis
+    # comment fields set by transfer_tags) are kept in _extra, created on first use.
+    __slots__ = ('file_name', 'f_type', 'sort_key', 'read_error', '_extra', *f_tags, *t_tags)
+    _fields = frozenset(('file_name', 'f_type', *f_tags, *t_tags))
+
     def __setitem__(self, key, value):
-        setattr(self, key, value)
+        value = str(value)
+        if key in self._fields:
+            if key in self.shared_fields:
+                value = sys.intern(value)
+            setattr(self, key, value)
+            if key in self.sort_fields:
+                self.sort_key = (self.t_artist, self.t_album, self.t_track)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
 
     def __getitem__(self, key):
-        return str(getattr(self, key))
+        if key in self._fields:
+            return getattr(self, key)
+        if self._extra is None:
+            raise KeyError(key)
+        return self._extra[key]
 
     def __get_file_info__(self, file):
 
@@ -69,24 +285,44 @@ class FileInfo():
         '''
             Sort function, first compare by artist, then album, and then track number
         '''
-        return (self['t_artist'], self['t_album'], self['t_track']) < (other['t_artist'], other['t_album'], other['t_track'])
-                    
+        return self.sort_key < other.sort_key
+
+    def _clear(self):
+        self._extra = None
+        self.read_error = False
+        for tag in self._fields:
+            setattr(self, tag, '')
+        self.sort_key = ('', '', '')
+
+    def fields(self):
+        '''Return dict of all file and tag fields except file_name.'''
+        return {key : getattr(self, key) for key in self._fields if key != 'file_name'}
+
+    @classmethod
+    def from_fields(cls, file, fields):
+        '''Create FileInfo for file from a dict returned by fields(), without reading the file.'''
+        self = cls.__new__(cls)
+        self._clear()
+        self.file_name = file
+        for key, value in fields.items():
+            self[key] = value
+        return self
+
     def __init__(self, file):
         '''Extract tags from MP3 or FLAC file.'''
-        for tag in self.f_tags:
-            self[tag] = ''
-
-        for tag in self.t_tags.keys():
-            self[tag] = ''
+        self._clear()
 
         self.__get_file_info__(file)
         
         if self.f_type == 'mp3':
-            try:
-                mp3_tags = ID3(file)
-            except MutagenError as e:
-                print(f"Error reading {file}: {e}")
-                return
+            mp3_tags = read_id3_text_frames(file, [vals['id3'] for vals in self.t_tags.values()])
+            if mp3_tags is None:
+                try:
+                    mp3_tags = ID3(file)
+                except MutagenError as e:
+                    print(f"Error reading {file}: {e}")
+                    self.read_error = True
+                    return
 
             for tag in self.t_tags:
                 id3 = self.t_tags[tag]['id3']
@@ -94,11 +330,14 @@ class FileInfo():
                     self[tag] = mp3_tags[id3]
 
         elif self.f_type == 'flac':
-            try:
-                flac_tags = FLAC(file)
-            except MutagenError as e:
-                print(f"Error reading {file}: {e}")
-                return
+            flac_tags = read_flac_comments(file)
+            if flac_tags is None:
+                try:
+                    flac_tags = FLAC(file)
+                except MutagenError as e:
+                    print(f"Error reading {file}: {e}")
+                    self.read_error = True
+                    return
 
             for tag, vals in self.t_tags.items():
                 v = vals['vorbis']
@@ -134,6 +373,85 @@ class FileInfo():
             print(f'Saving file: {self.file_name}')
     #        flac_tags.save()
             
+def set_tag_cache_mode(mode):
+    '''Set usage of the tag cache to 'on' or 'off'.'''
+    tag_cache_usage.mode = mode
+
+def add_tag_cache_args(parser):
+    '''Add option --no-tag-cache to an ArgumentParser.'''
+    parser.add_argument('--no-tag-cache', action='store_true', help='Do not use the tag cache.')
+
+def set_tag_cache_args(args):
+    '''Set usage of the tag cache from options added by add_tag_cache_args.'''
+    if args.no_tag_cache:
+        set_tag_cache_mode('off')
+
+def tag_fingerprint():
+    '''Return fingerprint of the fields extracted by FileInfo, cached tags
+    are discarded when it changes.'''
+    desc = repr((sorted(FileInfo.t_tags.items()), sorted(FileInfo.f_tags)))
+    return hashlib.md5(desc.encode('utf-8')).hexdigest()
+
+def get_tag_cache():
+    '''Return the tag cache, opening it on first use, or None if disabled.'''
+    return tag_cache_usage.get()
+
+def read_file_info(file):
+    '''Read tags of file, bypassing the cache.
+
+    Return tuple (st, FileInfo), st is the result of os.stat() before reading,
+    or None if that failed (e.g. a broken symlink), FileInfo reports the error.
+    '''
+    try:
+        st = os.stat(file)
+    except OSError:
+        st = None
+    return st, FileInfo(file)
+
+def lookup_file_info(file):
+    '''Return FileInfo for file from the tag cache, or None if not cached or modified.'''
+    cache = get_tag_cache()
+    if cache is None:
+        return None
+    try:
+        st = os.stat(file)
+    except OSError:
+        return None
+    fields = cache.get(os.path.abspath(file), st.st_size, st.st_mtime_ns)
+    if fields is None:
+        return None
+    return FileInfo.from_fields(file, fields)
+
+def store_file_info(st, fi):
+    '''Store FileInfo fi read from a file with stat result st in the tag cache.'''
+    cache = get_tag_cache()
+    # Files which could not be read are not cached, so the error is reported again
+    if cache is None or st is None or fi.read_error:
+        return
+    cache.put(os.path.abspath(fi.file_name), st.st_size, st.st_mtime_ns, fi.fields())
+
+def get_file_info(file):
+    '''Return FileInfo for file, only reading the file if it is new or modified
+    since it was stored in the tag cache.'''
+    fi = lookup_file_info(file)
+    if fi is None:
+        st, fi = read_file_info(file)
+        store_file_info(st, fi)
+    return fi
+
+### Columns of a tag catalog created with open_tag_catalog(db_file, CATALOG_FIELDS)
+CATALOG_FIELDS = sorted(FileInfo._fields - {'file_name'})
+
+def open_tag_catalog(db_file, columns=None):
+    '''Open the tag catalog db_file. If columns (list of field names, e.g. CATALOG_FIELDS)
+    are given, a new one is created with them, otherwise db_file must exist.'''
+    return tag_catalog.TagCatalog(db_file, columns)
+
+def find_file_infos(catalog, **criteria):
+    '''Return list of FileInfo of all files in the tag catalog whose fields equal the
+    keyword arguments, e.g. find_file_infos(catalog, t_artist='Artist', t_track='3').'''
+    return [FileInfo.from_fields(file, fields) for file, fields in catalog.find(**criteria)]
+
 def read_csv(csv_file):
     '''Read CSV file and store contents in FileInfo objects
     '''
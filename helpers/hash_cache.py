@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+# Persistent cache for file hashes.
+#
+# Hashes are stored in an SQLite database next to this module. Entries are keyed by
+# device, inode, size and modification time (ns) of the file, so a file which has been
+# modified, replaced or moved to another device is hashed again. The path is stored for
+# reference only.
+# The number of entries is limited to max_entries, the least recently used entries are
+# evicted when the cache is closed.
+
+import os
+import time
+import pathlib
+from sqlite_cache import SQLiteCache
+
+CACHE_FILE = pathlib.Path(__file__).resolve().parent / 'hash_cache.sqlite'
+MAX_ENTRIES = 2000000
+
+class HashCache(SQLiteCache):
+
+    table = 'hashes'
+
+    def __init__(self, db_file=CACHE_FILE, max_entries=MAX_ENTRIES):
+        super().__init__(db_file)
+        self.max_entries = max_entries
+        self._now = int(time.time())
+        self._db.execute('''CREATE TABLE IF NOT EXISTS hashes (
+            dev         INTEGER,
+            ino         INTEGER,
+            size        INTEGER,
+            mtime_ns    INTEGER,
+            algo        TEXT,
+            digest      TEXT,
+            path        TEXT,
+            last_used   INTEGER,
+            PRIMARY KEY (dev, ino, size, mtime_ns, algo))''')
+        self._db.execute('CREATE INDEX IF NOT EXISTS hashes_last_used ON hashes (last_used)')
+        self._db.commit()
+
+    @staticmethod
+    def key(st):
+        '''Return cache key for result of os.stat().'''
+        return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def get(self, st, algo):
+        '''Return cached digest of file with stat result st, or None.'''
+        key = self.key(st)
+        with self._lock:
+            row = self._db.execute(
+                'SELECT digest, last_used FROM hashes WHERE dev=? AND ino=? AND size=? AND mtime_ns=? AND algo=?',
+                (*key, algo)).fetchone()
+            if row is None:
+                return None
+            if row[1] != self._now:
+                self._db.execute(
+                    'UPDATE hashes SET last_used=? WHERE dev=? AND ino=? AND size=? AND mtime_ns=? AND algo=?',
+                    (self._now, *key, algo))
+                self._written()
+        return row[0]
+
+    def put(self, path, st, algo, digest):
+        '''Store digest of file path with stat result st.'''
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (*self.key(st), algo, digest, os.fsdecode(path), self._now))
+            self._written()
+
+    def evict(self):
+        '''Remove least recently used entries exceeding max_entries.'''
+        num = len(self) - self.max_entries
+        if num > 0:
+            with self._lock:
+                self._db.execute(
+                    'DELETE FROM hashes WHERE rowid IN (SELECT rowid FROM hashes ORDER BY last_used LIMIT ?)', (num,))
+                self._db.commit()
+
+    def close(self):
+        self.evict()
+        super().close()
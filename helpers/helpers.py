@@ -2,16 +2,199 @@
 
 import sys, re, os.path, chardet, glob, shlex, subprocess, pathlib
 import fnmatch
+import hashlib
+import threading
+import collections
+import itertools
+import array
+import concurrent.futures
+import zlib
+import codecs
+import unicodedata
+import hash_cache
+import sqlite_cache
+import md5_index
+
+### Size of the read buffer used for hashing files
+HASH_CHUNK_SIZE = 1024 * 1024
+
+### Per-thread read buffers, allocated once and reused for every file
+_hash_buffers = threading.local()
+
+### Usage of the persistent hash cache (hash_cache_usage.mode):
+###   'on'      look up hashes in the cache, hash and store files not found
+###   'off'     don't use the cache at all (--no-cache)
+###   'verify'  hash all files and report cache entries not matching (--verify-cache)
+hash_cache_usage = sqlite_cache.CacheUsage('Hash cache', hash_cache.HashCache)
 
 ### strip trailing newline and convert to UTF-8
 def strip_shell(txt):
 	return txt[:-1].decode('utf-8')
 
-### Calculate MD5 hash of file, using md5sum
+def _get_hash_buffer():
+    buf = getattr(_hash_buffers, 'buf', None)
+    if buf is None:
+        buf = bytearray(HASH_CHUNK_SIZE)
+        _hash_buffers.buf = buf
+    return buf
+
+def hash_file(file, hashers):
+    '''Feed the content of file into all hash objects in hashers.
+
+    The file is read unbuffered in chunks of HASH_CHUNK_SIZE into a
+    preallocated buffer, so no intermediate bytes objects are created.
+    '''
+    buf = _get_hash_buffer()
+    view = memoryview(buf)
+    with open(file, 'rb', buffering=0) as fh:
+        while n := fh.readinto(buf):
+            chunk = view[:n]
+            for h in hashers:
+                h.update(chunk)
+    return hashers
+
+def set_hash_cache_mode(mode):
+    '''Set usage of the hash cache to 'on', 'off' or 'verify'.'''
+    hash_cache_usage.mode = mode
+
+def add_hash_cache_args(parser):
+    '''Add options --no-cache and --verify-cache to an ArgumentParser.'''
+    parser.add_argument('--no-cache', action='store_true', help='Do not use the hash cache.')
+    parser.add_argument('--verify-cache', action='store_true', help='Re-hash all files and verify the hash cache.')
+
+def set_hash_cache_args(args):
+    '''Set usage of the hash cache from options added by add_hash_cache_args.'''
+    if args.no_cache:
+        set_hash_cache_mode('off')
+    elif args.verify_cache:
+        set_hash_cache_mode('verify')
+
+def get_hash_cache():
+    '''Return the hash cache, opening it on first use, or None if disabled.'''
+    return hash_cache_usage.get()
+
+class CRC32():
+    '''CRC32 with the interface of the hashlib hash objects.'''
+    name = 'crc32'
+
+    def __init__(self):
+        self._crc = 0
+
+    def update(self, data):
+        self._crc = zlib.crc32(data, self._crc)
+
+    def hexdigest(self):
+        return f'{self._crc:08x}'
+
+def new_hasher(algo):
+    '''Return hash object for algo, e.g. 'md5', 'sha256', 'blake2b' or 'crc32'.'''
+    if algo == 'crc32':
+        return CRC32()
+    return hashlib.new(algo)
+
+def _file_hexdigests(file, algos):
+    hashers = [new_hasher(algo) for algo in algos]
+    hash_file(file, hashers)
+    return {algo : h.hexdigest() for algo, h in zip(algos, hashers)}
+
+def file_digests(file, algos):
+    '''Return dict of hex digests of file for all algorithms in algos.
+
+    The file is read at most once, no matter how many digests are requested.
+    Digests found in the hash cache are not calculated again.
+    '''
+    cache = get_hash_cache()
+    if cache is None:
+        return _file_hexdigests(file, algos)
+
+    st = os.stat(file)
+    digests = {algo : cache.get(st, algo) for algo in algos}
+    if hash_cache_usage.mode == 'verify':
+        missing = list(algos)
+    else:
+        missing = [algo for algo in algos if not digests[algo]]
+    if not missing:
+        return digests
+
+    new_digests = _file_hexdigests(file, missing)
+    unchanged = cache.key(os.stat(file)) == cache.key(st)
+    for algo, new_digest in new_digests.items():
+        if digests[algo] and digests[algo] != new_digest:
+            print(f'Hash cache mismatch for {file}: cached {algo} {digests[algo]}, actual {new_digest}')
+        # Only store the digest if the file did not change while reading it
+        if unchanged:
+            cache.put(file, st, algo, new_digest)
+        digests[algo] = new_digest
+    return digests
+
+def file_digest(file, algo):
+    '''Return hex digest of file, using the hash cache if enabled.'''
+    return file_digests(file, [algo])[algo]
+
+### Calculate MD5 hash of file (same output as md5sum)
 def file_md5(file):
-	args = shlex.split('/usr/bin/md5sum "{}"'.format(file))
-	p = subprocess.Popen(args, stdout=subprocess.PIPE)
-	return p.stdout.read().decode('utf-8').split()[0]
+    return file_digest(file, 'md5')
+
+def file_head_tail_md5(file, length=64 * 1024):
+    '''Return MD5 hash of the first and the last length bytes of file.
+
+    This is meant as a cheap pre-check, e.g. to find candidates for duplicates,
+    without reading whole files.
+    '''
+    h = hashlib.md5()
+    with open(file, 'rb') as fh:
+        h.update(fh.read(length))
+        size = fh.seek(0, os.SEEK_END)
+        if size > length:
+            fh.seek(max(length, size - length))
+            h.update(fh.read(length))
+    return h.hexdigest()
+
+def _try_call(func, path):
+    try:
+        return path, func(path)
+    except OSError as e:
+        print(f"Error reading {path}: {e}")
+        return path, None
+
+def run_pool(func, paths, jobs=None, ordered=False):
+    '''Apply func to every path using a pool of worker threads.
+
+    Yield tuples (path, result). If ordered is True, results are returned in
+    the order of paths, otherwise as soon as they are finished. paths may be
+    any iterable (e.g. a generator walking a directory), it is consumed lazily
+    and only a bounded number of items is in flight at any time.
+    If func raises an OSError, the error is printed and result is None.
+    '''
+    jobs = jobs or os.cpu_count() or 1
+    max_pending = 4 * jobs
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        if ordered:
+            pending = collections.deque()
+            for path in paths:
+                pending.append(executor.submit(_try_call, func, path))
+                if len(pending) >= max_pending:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        else:
+            pending = set()
+            for path in paths:
+                pending.add(executor.submit(_try_call, func, path))
+                if len(pending) >= max_pending:
+                    done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for f in done:
+                        yield f.result()
+            for f in concurrent.futures.as_completed(pending):
+                yield f.result()
+
+def hash_many(paths, jobs=None, ordered=False):
+    '''Calculate MD5 hashes of many files in parallel.
+
+    Yield tuples (path, md5) as soon as they are finished, or in the order of
+    paths if ordered is True. md5 is None if the file could not be read.
+    '''
+    return run_pool(file_md5, paths, jobs=jobs, ordered=ordered)
 
 # Determine file type
 def file_type(file):
@@ -25,10 +208,17 @@ def file_size(file):
 	size = os.stat(file).st_size
 	return size
 
+### Compiled patterns for split_hash_filename, by number of hex digits
+_hash_patterns = {}
+
 # Return tuple consisting of hash and filename, or None
-def split_hash_filename(line):
-    pattern = re.compile(r"([0-9a-f]{32})(\s+\**)(.*)")
-    m = re.search(pattern, line)
+# digest_len is the number of hex digits of the hash, 32 for MD5, 64 for SHA-256 etc.
+def split_hash_filename(line, digest_len=32):
+    pattern = _hash_patterns.get(digest_len)
+    if pattern is None:
+        pattern = re.compile(r"([0-9a-f]{%d})(\s+\**)(.*)" % digest_len)
+        _hash_patterns[digest_len] = pattern
+    m = pattern.search(line)
     if m:
         d = dict()
         d['hash'] = m.group(1)
@@ -36,6 +226,293 @@ def split_hash_filename(line):
         d['file'] = m.group(3)
         return d
 
+### Same as the pattern of split_hash_filename, but never matching across lines
+_hash_line_pattern = re.compile(r"([0-9a-f]{32})([^\S\r\n]+\**)([^\r\n]*)")
+### Faster variant, only valid if all hashes found consist of hex digits
+_hash_line_pattern_fast = re.compile(r"(.{32})([^\S\n]+\**)(.*)")
+_hex_pattern = re.compile(r"[0-9a-f]*")
+
+class HashColumns():
+    '''Entries of an MD5 list, stored in columns.
+
+    digests     binary MD5 hashes of all entries, 16 bytes each (bytearray)
+    ws          separator of each entry, white-space optionally followed by '*'
+    files       file name of each entry
+    '''
+    DIGEST_SIZE = 16
+
+    def __init__(self):
+        self.digests = bytearray()
+        self.ws = []
+        self.files = []
+
+    def __len__(self):
+        return len(self.files)
+
+    def add_block(self, block):
+        '''Parse all lines in block (str) and append them.'''
+        if '\r' in block:
+            block = block.replace('\r\n', '\n')
+        columns = None
+        if '\r' not in block:
+            # Matching any 32 characters is much faster. If they are all hex
+            # digits, the result is the same as with the exact pattern.
+            columns = list(zip(*_hash_line_pattern_fast.findall(block)))
+            if columns and not _hex_pattern.fullmatch(''.join(columns[0])):
+                columns = None
+        if columns is None:
+            columns = list(zip(*_hash_line_pattern.findall(block)))
+        if not columns:
+            return
+        hashes, ws, files = columns
+        self.digests += bytes.fromhex(''.join(hashes))
+        self.ws.extend(map(sys.intern, ws))
+        self.files.extend(files)
+
+    def digest(self, i):
+        return bytes(self.digests[i * self.DIGEST_SIZE : (i + 1) * self.DIGEST_SIZE])
+
+    def hash(self, i):
+        '''Return hash of entry i as hex string, as in the MD5 list.'''
+        return self.digest(i).hex()
+
+    def iter_digests(self):
+        d = bytes(self.digests)
+        return (d[i : i + self.DIGEST_SIZE] for i in range(0, len(d), self.DIGEST_SIZE))
+
+def _join_lines(data, block_len=1024 * 1024):
+    batch = []
+    num = 0
+    for line in data:
+        batch.append(line)
+        num += len(line)
+        if num >= block_len:
+            yield '\n'.join(batch)
+            batch = []
+            num = 0
+    if batch:
+        yield '\n'.join(batch)
+
+def parse_hash_lines(data):
+    '''Parse lines created by md5sum or MD5Summer in bulk.
+
+    data is either a single string containing many lines, or an iterable of
+    strings (lines or blocks of lines). Accepts the same formats as
+    split_hash_filename, lines without a hash are skipped.
+    Return a HashColumns object.
+    '''
+    cols = HashColumns()
+    if isinstance(data, str):
+        cols.add_block(data)
+    else:
+        for block in _join_lines(data):
+            cols.add_block(block)
+    return cols
+
+def read_hash_columns(in_fname):
+    '''Read file created by md5sum or MD5Summer into a HashColumns object.'''
+    return parse_hash_lines(iter_text_blocks(in_fname))
+
+class ChecksumTable():
+    '''Compact table of the entries of an MD5 list.
+
+    Instead of one object per entry, all data is stored in a few flat arrays:
+    digests     binary MD5 hashes of all entries, 16 bytes each (bytearray)
+    dirs        unique folder names including the trailing separator, shared by all entries
+    dir_idx     index into dirs for every entry (array of unsigned int)
+    names       base names of all entries, UTF-8 encoded and concatenated (bytearray)
+    name_off    start offset of every base name in names, plus the end offset (array of unsigned long long)
+
+    An entry takes 28 bytes plus its base name, folder names are stored once. Unlike
+    the folders, base names are not interned: most of them are unique (e.g. track
+    titles), and a lookup table would need several times the memory of the names
+    themselves. Compared to one object per entry, memory drops by about 3.5 times
+    (1M lines: 270 MiB to 78 MiB), not by an order of magnitude, which would require
+    the names to be compressed.
+    '''
+    DIGEST_SIZE = 16
+
+    def __init__(self):
+        self.digests = bytearray()
+        self.dirs = []
+        self._dir_ids = {}
+        self.dir_idx = array.array('I')
+        self.names = bytearray()
+        self.name_off = array.array('Q', [0])
+
+    def __len__(self):
+        return len(self.dir_idx)
+
+    def add_columns(self, cols):
+        '''Append all entries of a HashColumns object.'''
+        self.digests += cols.digests
+        dir_ids = self._dir_ids
+        names = []
+        for f in cols.files:
+            i = max(f.rfind('/'), f.rfind('\\')) + 1
+            d = f[:i]
+            idx = dir_ids.get(d)
+            if idx is None:
+                idx = dir_ids[d] = len(self.dirs)
+                self.dirs.append(d)
+            self.dir_idx.append(idx)
+            names.append(f[i:].encode('utf-8', 'surrogatepass'))
+        self.names += b''.join(names)
+        self.name_off.extend(itertools.islice(itertools.accumulate(map(len, names), initial=self.name_off[-1]), 1, None))
+
+    def digest(self, i):
+        return bytes(self.digests[i * self.DIGEST_SIZE : (i + 1) * self.DIGEST_SIZE])
+
+    def hash(self, i):
+        '''Return hash of entry i as hex string, as in the MD5 list.'''
+        return self.digest(i).hex()
+
+    def file(self, i):
+        '''Return file name of entry i, as in the MD5 list.'''
+        name = self.names[self.name_off[i] : self.name_off[i + 1]].decode('utf-8', 'surrogatepass')
+        return self.dirs[self.dir_idx[i]] + name
+
+    def sorted_indices(self):
+        '''Return indices of all entries sorted by digest, entries with the same
+        digest keep their order (array of unsigned int).'''
+        d = bytes(self.digests)
+        n = self.DIGEST_SIZE
+        # Distribute the entries into buckets by their first two bytes first, so
+        # sort keys are only created for one small bucket at a time
+        buckets = collections.defaultdict(lambda: array.array('I'))
+        for i, prefix in enumerate(memoryview(d).cast('H')[::n // 2]):
+            buckets[prefix].append(i)
+        order = array.array('I')
+        for prefix in sorted(buckets, key=lambda p: d[buckets[p][0] * n : buckets[p][0] * n + 2]):
+            order.extend(sorted(buckets[prefix], key=lambda i: d[i * n : (i + 1) * n]))
+        return order
+
+    def iter_groups(self, order):
+        '''Group entries with the same digest, order as returned by sorted_indices.
+
+        Yield (digest, (start, end)) for every digest, the entries are
+        order[start:end].
+        '''
+        d = bytes(self.digests)
+        n = self.DIGEST_SIZE
+        start = 0
+        prev = None
+        for pos, i in enumerate(order):
+            digest = d[i * n : (i + 1) * n]
+            if digest != prev:
+                if prev is not None:
+                    yield prev, (start, pos)
+                prev = digest
+                start = pos
+        if prev is not None:
+            yield prev, (start, len(order))
+
+def read_checksum_table(in_fname):
+    '''Read file created by md5sum or MD5Summer into a ChecksumTable object.'''
+    table = ChecksumTable()
+    for block in iter_text_blocks(in_fname):
+        table.add_columns(parse_hash_lines(block))
+    return table
+
+def open_checksums(in_fname):
+    '''Open an MD5 list or an MD5 index file (.md5idx).
+
+    Return an md5_index.MD5Index for index files, otherwise read the list into
+    a ChecksumTable. Both provide the same interface.
+    '''
+    if md5_index.is_index_file(in_fname):
+        return md5_index.MD5Index(in_fname)
+    return read_checksum_table(in_fname)
+
+### Number of bytes used to detect the encoding of a text file
+ENCODING_SAMPLE_SIZE = 1024 * 1024
+
+def detect_encoding(sample):
+    '''Detect encoding of sample (bytes) from the start of a text file.
+
+    Files created with md5sum on UNIX are expected to be UTF-8, which is
+    checked first. Otherwise, the encoding is guessed by chardet, falling back
+    to Latin-1 as used by MD5Summer on Windows.
+    '''
+    try:
+        # The sample may end within a multi-byte character
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
+    det = chardet.detect(sample)
+    if det['encoding'] and det['confidence'] > 0.5:
+        return det['encoding']
+    return 'latin-1'
+
+### Number of bytes read at once by iter_text_blocks
+TEXT_BLOCK_SIZE = 4 * 1024 * 1024
+
+def _decode_block(block, encoding):
+    try:
+        return block.decode(encoding)
+    except UnicodeDecodeError:
+        pass
+    lines = []
+    for raw in block.split(b'\n'):
+        try:
+            lines.append(raw.decode(encoding))
+        except UnicodeDecodeError:
+            lines.append(raw.decode('latin-1'))
+    return '\n'.join(lines)
+
+def iter_text_blocks(in_fname, block_size=TEXT_BLOCK_SIZE):
+    '''Yield the content of a text file in decoded blocks of complete lines.
+
+    The encoding is detected on the first ENCODING_SAMPLE_SIZE bytes only.
+    Single lines which can't be decoded with this encoding are decoded as
+    Latin-1, so the whole file never has to be kept in memory.
+    '''
+    with open(in_fname, 'rb') as in_f:
+        encoding = detect_encoding(in_f.read(ENCODING_SAMPLE_SIZE))
+        print('File {}, encoding: {}'.format(in_fname, encoding))
+        in_f.seek(0)
+
+        if codecs.lookup(encoding).name.startswith(('utf-16', 'utf-32')):
+            # Multi-byte line endings, let the text layer split lines
+            with open(in_fname, mode='r', encoding=encoding, errors='replace') as text_f:
+                rest = ''
+                while block := text_f.read(block_size):
+                    block = rest + block
+                    end = block.rfind('\n') + 1
+                    rest = block[end:]
+                    if end:
+                        yield block[:end]
+                if rest:
+                    yield rest
+            return
+
+        rest = b''
+        while block := in_f.read(block_size):
+            block = rest + block
+            end = block.rfind(b'\n') + 1
+            rest = block[end:]
+            if end:
+                yield _decode_block(block[:end], encoding)
+        if rest:
+            yield _decode_block(rest, encoding)
+
+def iter_lines(in_fname):
+    '''Yield the lines of a text file without line endings, one at a time.'''
+    for block in iter_text_blocks(in_fname):
+        yield from block.splitlines()
+
+def iter_hash_records(in_fname):
+    '''Yield the entries of a file created by md5sum or MD5Summer, one at a time.
+
+    Each entry is a dict as returned by split_hash_filename, lines not
+    containing a hash are skipped.
+    '''
+    for line in iter_lines(in_fname):
+        item = split_hash_filename(line)
+        if item:
+            yield item
+
 def open_and_decode_file(in_fname):
 
     with open(in_fname, 'rb', encoding=None) as in_f:
@@ -46,6 +523,31 @@ def open_and_decode_file(in_fname):
         return data
 
 
+### Unicode problems in file names and tags:
+###   'cdm'          combining diacritical mark (U+0300 to U+037F), e.g. 'i' plus COMBINING ACUTE ACCENT
+###   'not_nfc'      not in normalization form NFC, e.g. decomposed as on macOS
+###   'mojibake'     UTF-8 decoded as Latin-1/cp1252, e.g. 'Ã©' instead of 'é'
+###   'undecodable'  bytes which are not valid UTF-8, kept as surrogates by 'surrogateescape'
+UNICODE_ISSUES = ('cdm', 'not_nfc', 'mojibake', 'undecodable')
+cdm_pattern = re.compile('[\u0300-\u037f]')
+_unicode_issue_pattern = re.compile('(?P<cdm>[\u0300-\u037f])|(?P<mojibake>Ã[\u0080-\u00bf€‚ƒ„…†‡ˆ‰Š‹ŒŽ‘’“”•–—˜™š›œžŸ])|(?P<undecodable>[\udc80-\udcff])')
+
+def find_cdm(value):
+    '''Return the first combining diacritical mark in value together with the character
+    before it (e.g. 'i\u0301'), or None if there is none.'''
+    m = cdm_pattern.search(value)
+    if m:
+        return value[max(m.start() - 1, 0):m.end()]
+
+def unicode_issues(value):
+    '''Return list of the Unicode problems found in value, see UNICODE_ISSUES.'''
+    if value.isascii():
+        return []
+    found = {m.lastgroup for m in _unicode_issue_pattern.finditer(value)}
+    if not unicodedata.is_normalized('NFC', value):
+        found.add('not_nfc')
+    return [issue for issue in UNICODE_ISSUES if issue in found]
+
 def check_ext(filename, filters=None):
     '''Check whether filename matches any filter in filters.
 
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+# Sorted binary index of an MD5 list (.md5idx), for fast lookups of hashes
+# without parsing the text list again.
+#
+# File layout, all integers little-endian:
+#   header      magic b'MD5IDX1\0', number of entries n (uint64)
+#   digests     n binary MD5 hashes, 16 bytes each, sorted (entries with the same
+#               hash keep the order of the MD5 list)
+#   offsets     n + 1 start offsets (uint64) of the file names in the name blob,
+#               the last one is the end of the blob
+#   names       file names of all entries, UTF-8 encoded and concatenated
+#
+# The index is memory-mapped, so opening it is cheap and only the pages touched by
+# the binary search are read from disk.
+
+import bisect
+import mmap
+import struct
+
+MAGIC = b'MD5IDX1\0'
+HEADER = struct.Struct('<8sQ')
+DIGEST_SIZE = 16
+OFFSET = struct.Struct('<Q')
+
+def is_index_file(fname):
+    '''Return True if fname is an MD5 index file.'''
+    try:
+        with open(fname, 'rb') as fh:
+            return fh.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+def write_index(table, out_fname):
+    '''Write the entries of a ChecksumTable to out_fname as MD5 index.'''
+    order = table.sorted_indices()
+    with open(out_fname, 'wb') as out_f:
+        out_f.write(HEADER.pack(MAGIC, len(order)))
+        for i in order:
+            out_f.write(table.digest(i))
+        names = [table.file(i).encode('utf-8', 'surrogatepass') for i in order]
+        offset = 0
+        for name in names:
+            out_f.write(OFFSET.pack(offset))
+            offset += len(name)
+        out_f.write(OFFSET.pack(offset))
+        for name in names:
+            out_f.write(name)
+
+class _Digests():
+    '''Sequence view of the digest table, for bisect.'''
+
+    def __init__(self, buf, num):
+        self._buf = buf
+        self._num = num
+
+    def __len__(self):
+        return self._num
+
+    def __getitem__(self, i):
+        start = HEADER.size + i * DIGEST_SIZE
+        return self._buf[start : start + DIGEST_SIZE]
+
+class MD5Index():
+    '''Memory-mapped MD5 index file.
+
+    Provides the same interface as ChecksumTable, so the MD5 tools can use
+    either of them. As the entries are already sorted, sorted_indices() is
+    trivial.
+    '''
+    DIGEST_SIZE = DIGEST_SIZE
+
+    def __init__(self, fname):
+        with open(fname, 'rb') as fh:
+            self._mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._num = HEADER.unpack_from(self._mm)
+        if magic != MAGIC:
+            self._mm.close()
+            raise ValueError(f'{fname} is not an MD5 index file')
+        self._digests = _Digests(self._mm, self._num)
+        self._off_start = HEADER.size + self._num * DIGEST_SIZE
+        self._names_start = self._off_start + (self._num + 1) * OFFSET.size
+
+    def __len__(self):
+        return self._num
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._mm.close()
+
+    def digest(self, i):
+        return self._digests[i]
+
+    def hash(self, i):
+        '''Return hash of entry i as hex string.'''
+        return self.digest(i).hex()
+
+    def file(self, i):
+        '''Return file name of entry i.'''
+        start, end = struct.unpack_from('<2Q', self._mm, self._off_start + i * OFFSET.size)
+        return self._mm[self._names_start + start : self._names_start + end].decode('utf-8', 'surrogatepass')
+
+    def find(self, digest):
+        '''Return range of the entries with binary digest.'''
+        start = bisect.bisect_left(self._digests, digest)
+        end = bisect.bisect_right(self._digests, digest, lo=start)
+        return range(start, end)
+
+    def lookup(self, m_hash):
+        '''Return list of all files with hash m_hash (hex string).'''
+        return [self.file(i) for i in self.find(bytes.fromhex(m_hash))]
+
+    def sorted_indices(self):
+        return range(self._num)
+
+    def iter_groups(self, order):
+        '''Group entries with the same digest, see ChecksumTable.iter_groups.'''
+        start = 0
+        while start < len(order):
+            digest = self.digest(order[start])
+            end = self.find(digest).stop
+            yield digest, (start, end)
+            start = end
@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+
+# Test files for the tests of extract_tags and the tools using it.
+
+from mutagen.id3 import ID3, ID3v1SaveOptions
+
+### A few MPEG audio frame headers, enough for mutagen to accept the file as MP3
+MP3_AUDIO = b'\xff\xfb\x90\x00' * 100
+
+def write_mp3(path, frames=None, v2_version=4, v1=ID3v1SaveOptions.REMOVE, padding=None):
+    '''Write MP3 file path with an ID3 tag containing frames (list of mutagen frames),
+    or without tag if frames is None. Missing parent folders are created.'''
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(MP3_AUDIO)
+    if frames is None:
+        return
+    tag = ID3()
+    for frame in frames:
+        tag.add(frame)
+    tag.save(path, v2_version=v2_version, v1=v1, padding=padding)
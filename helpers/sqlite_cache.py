@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+# Common parts of the persistent caches in SQLite databases (hash_cache, tag_cache).
+#
+# The databases are opened in WAL mode, so several processes can use a cache at the
+# same time. The connection is shared by all threads of a process, writes are committed
+# every COMMIT_INTERVAL entries and when the cache is closed.
+# CacheUsage holds the usage mode of a cache set by the command line tools, and opens
+# the cache on first use.
+
+import sqlite3
+import threading
+import atexit
+
+COMMIT_INTERVAL = 1000
+
+class SQLiteCache():
+    '''Base class of the caches. Subclasses create their tables, len() counts the
+    entries of table.'''
+
+    table = None
+
+    def __init__(self, db_file):
+        self._lock = threading.Lock()
+        self._num_writes = 0
+        self._db = sqlite3.connect(str(db_file), timeout=60, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+
+    def _written(self):
+        self._num_writes += 1
+        if self._num_writes % COMMIT_INTERVAL == 0:
+            self._db.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute(f'SELECT COUNT(*) FROM {self.table}').fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.commit()
+            self._db.close()
+
+class CacheUsage():
+    '''Usage mode of a cache. The cache is opened by open_cache() on first use and
+    closed at exit. In mode 'off' it is not used, the meaning of other modes (e.g. 'on')
+    is up to the user.'''
+
+    def __init__(self, name, open_cache, mode='on'):
+        self.name = name
+        self.mode = mode
+        self._open_cache = open_cache
+        self._cache = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        '''Return the cache, opening it on first use, or None if disabled.'''
+        if self.mode == 'off':
+            return None
+        with self._lock:
+            if self._cache is None:
+                try:
+                    self._cache = self._open_cache()
+                except (sqlite3.Error, OSError) as e:
+                    print(f'{self.name} not available, disabling it: {e}')
+                    self.mode = 'off'
+                    return None
+                atexit.register(self.close)
+        return self._cache
+
+    def close(self):
+        if self._cache:
+            self._cache.close()
+            self._cache = None
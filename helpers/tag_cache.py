@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+
+# Persistent cache for tags extracted from MP3 and FLAC files.
+#
+# Tags are stored in an SQLite database next to this module. Entries are keyed by the
+# absolute path of the file (as bytes, as file names need not be valid UTF-8) and are
+# only valid as long as size and modification time (ns) of the file are unchanged.
+# The fields are stored as JSON. The cache is cleared whenever the fingerprint of the
+# extracted fields changes, e.g. after adding a tag to FileInfo.t_tags.
+
+import os
+import json
+import pathlib
+from sqlite_cache import SQLiteCache
+
+CACHE_FILE = pathlib.Path(__file__).resolve().parent / 'tag_cache.sqlite'
+
+class TagCache(SQLiteCache):
+
+    table = 'tags'
+
+    def __init__(self, fingerprint, db_file=CACHE_FILE):
+        super().__init__(db_file)
+        self._db.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        self._db.execute('''CREATE TABLE IF NOT EXISTS tags (
+            path        BLOB PRIMARY KEY,
+            size        INTEGER,
+            mtime_ns    INTEGER,
+            fields      TEXT)''')
+        row = self._db.execute("SELECT value FROM meta WHERE key='fingerprint'").fetchone()
+        if row is None or row[0] != fingerprint:
+            self._db.execute('DELETE FROM tags')
+            self._db.execute("INSERT OR REPLACE INTO meta VALUES ('fingerprint', ?)", (fingerprint,))
+        self._db.commit()
+
+    def get(self, path, size, mtime_ns):
+        '''Return dict of cached fields of file path, or None if not cached or modified.'''
+        with self._lock:
+            row = self._db.execute('SELECT size, mtime_ns, fields FROM tags WHERE path=?', (os.fsencode(path),)).fetchone()
+        if row is None or row[0] != size or row[1] != mtime_ns:
+            return None
+        return json.loads(row[2])
+
+    def put(self, path, size, mtime_ns, fields):
+        '''Store dict fields of file path.'''
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO tags VALUES (?, ?, ?, ?)',
+                (os.fsencode(path), size, mtime_ns, json.dumps(fields)))
+            self._written()
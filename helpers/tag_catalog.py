@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+# Catalog of the tags of a music library in an SQLite database.
+#
+# Unlike the tag cache, which is keyed by path only, the catalog has one column per
+# field and indexes on artist, album and track number, so files can be looked up by
+# their tags without scanning all entries. File names are stored as bytes, as they
+# need not be valid UTF-8. Field values which are not valid UTF-8 either (e.g. parts
+# of such file names) are stored as bytes as well.
+
+import os
+import sqlite3
+
+### Indexes created if all their columns are part of the catalog
+INDEXES = {
+    'idx_tags'   : ('t_artist', 't_album', 't_track'),
+    'idx_album'  : ('t_album',),
+    'idx_folder' : ('f_artist', 'f_album', 'f_track'),
+}
+
+def _to_db(value):
+    try:
+        value.encode('utf-8')
+    except UnicodeEncodeError:
+        return value.encode('utf-8', errors='surrogateescape')
+    return value
+
+def _from_db(value):
+    if isinstance(value, bytes):
+        return value.decode('utf-8', errors='surrogateescape')
+    return value
+
+class TagCatalog():
+
+    def __init__(self, db_file, columns=None):
+        '''Open catalog db_file. A new catalog is created with columns (list of field
+        names), an existing one keeps its columns. Without columns, db_file must exist.'''
+        if columns is None and str(db_file) != ':memory:' and not os.path.exists(db_file):
+            raise FileNotFoundError(f'{db_file}: no such tag catalog')
+        self._db = sqlite3.connect(str(db_file))
+        self.columns = [row[1] for row in self._db.execute('PRAGMA table_info(files)')][1:]
+        if not self.columns:
+            if not columns:
+                raise ValueError(f'{db_file} is not a tag catalog')
+            self.columns = list(columns)
+            self._db.execute('CREATE TABLE files (file_name BLOB PRIMARY KEY, {})'.format(
+                ', '.join(f'{col} TEXT' for col in self.columns)))
+            for name, index_columns in INDEXES.items():
+                if all(col in self.columns for col in index_columns):
+                    self._db.execute(f'CREATE INDEX {name} ON files ({', '.join(index_columns)})')
+            self._db.commit()
+        self._insert = 'INSERT OR REPLACE INTO files VALUES ({})'.format(', '.join('?' * (len(self.columns) + 1)))
+
+    def add(self, rows):
+        '''Store rows, an iterable of tuples (file name, dict of fields), and commit.
+        Columns missing from a dict are stored empty, fields without column are ignored.'''
+        self._db.executemany(self._insert,
+            ((os.fsencode(file), *(_to_db(fields.get(col, '')) for col in self.columns)) for file, fields in rows))
+        self._db.commit()
+
+    def clear(self):
+        '''Remove all files from the catalog.'''
+        self._db.execute('DELETE FROM files')
+        self._db.commit()
+
+    def file_names(self):
+        '''Return set of the names of all files in the catalog.'''
+        return {os.fsdecode(row[0]) for row in self._db.execute('SELECT file_name FROM files')}
+
+    def find(self, **criteria):
+        '''Return list of tuples (file name, dict of fields) of all files whose fields equal
+        the keyword arguments, e.g. find(t_artist='Artist', t_album='Album'), sorted by
+        artist, album and track number.'''
+        for col in criteria:
+            if col not in self.columns:
+                raise ValueError(f'unknown field: {col}')
+        query = 'SELECT * FROM files'
+        if criteria:
+            query += ' WHERE ' + ' AND '.join(f'{col}=?' for col in criteria)
+        order = [col for col in ('t_artist', 't_album') if col in self.columns]
+        if 't_track' in self.columns:
+            # Numerically, so that track 10 follows track 2 (unlike FileInfo.sort_key)
+            order += ['CAST(t_track AS INTEGER)', 't_track']
+        query += ' ORDER BY {}'.format(', '.join(order + ['file_name']))
+        rows = self._db.execute(query, [_to_db(value) for value in criteria.values()])
+        return [(os.fsdecode(row[0]), {col : _from_db(value) for col, value in zip(self.columns, row[1:])}) for row in rows]
+
+    def __len__(self):
+        return self._db.execute('SELECT COUNT(*) FROM files').fetchone()[0]
+
+    def close(self):
+        self._db.commit()
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,130 @@
+#!/bin/python3
+
+import pytest
+from mutagen.id3 import ID3, APIC, TPE1, TPE2, TALB, TIT2, TRCK, TDRC, TCON, TYER, TDAT, TXXX
+from mutagen.id3 import ID3v1SaveOptions
+from mutagen.flac import FLAC, Picture
+import extract_tags
+from mp3_fixtures import write_mp3
+
+FRAME_IDS = [vals['id3'] for vals in extract_tags.FileInfo.t_tags.values()]
+
+def assert_same_as_mutagen(path):
+    fast = extract_tags.read_id3_text_frames(path, FRAME_IDS)
+    assert fast is not None
+    tags = ID3(path)
+    assert {i : str(tags[i]) for i in FRAME_IDS if i in tags} == fast
+
+@pytest.mark.parametrize('v2_version', [3, 4])
+@pytest.mark.parametrize('encoding', [0, 1, 2, 3])
+def test_read_id3_text_frames(tmp_path, v2_version, encoding):
+    if v2_version == 3 and encoding in (2, 3):
+        pytest.skip('UTF-16BE and UTF-8 are not part of ID3v2.3')
+    path = tmp_path / '01 - Song.mp3'
+    text = 'Muller' if encoding == 0 else 'Müller ☺'
+    write_mp3(path, [
+        TPE1(encoding=encoding, text=[text, 'Second']),
+        TPE2(encoding=encoding, text=[text]),
+        TALB(encoding=encoding, text=['']),
+        TIT2(encoding=encoding, text=['Title']),
+        TRCK(encoding=encoding, text=['3/12']),
+        TDRC(encoding=encoding, text=['1999-05-01']),
+        TCON(encoding=encoding, text=['(17)', 'Trip-Hop']),
+        APIC(encoding=0, mime='image/jpeg', type=3, desc='', data=b'\x00' * 1000000),
+        TXXX(encoding=encoding, desc='x', text=['y']),
+    ], v2_version=v2_version)
+    assert_same_as_mutagen(path)
+
+def test_read_id3_text_frames_v23_year(tmp_path):
+    path = tmp_path / '01 - Song.mp3'
+    write_mp3(path, [TYER(encoding=0, text=['2001']), TIT2(encoding=0, text=['Title'])], v2_version=3)
+    assert_same_as_mutagen(path)
+    assert extract_tags.read_id3_text_frames(path, FRAME_IDS)['TDRC'] == '2001'
+
+@pytest.mark.parametrize('padding', [0, 5000])
+def test_read_id3_text_frames_padding(tmp_path, padding):
+    path = tmp_path / '01 - Song.mp3'
+    write_mp3(path, [TIT2(encoding=3, text=['Title']), TCON(encoding=3, text=['17'])], padding=lambda info: padding)
+    assert_same_as_mutagen(path)
+
+def test_read_id3_text_frames_fallback(tmp_path):
+    path = tmp_path / '01 - Song.mp3'
+
+    # Additional ID3v1 tag
+    write_mp3(path, [TIT2(encoding=3, text=['Title'])], v1=ID3v1SaveOptions.CREATE)
+    assert extract_tags.read_id3_text_frames(path, FRAME_IDS) is None
+
+    # Date split into TYER and TDAT
+    write_mp3(path, [TYER(encoding=0, text=['2001']), TDAT(encoding=0, text=['0105'])], v2_version=3)
+    assert extract_tags.read_id3_text_frames(path, FRAME_IDS) is None
+
+    # No tag at all
+    write_mp3(path)
+    assert extract_tags.read_id3_text_frames(path, FRAME_IDS) is None
+
+def test_file_info_mp3(tmp_path):
+    path = tmp_path / 'Artist' / 'Album' / '01 - Song.mp3'
+    write_mp3(path, [TPE1(encoding=3, text=['Artist']), TALB(encoding=1, text=['Album']), TRCK(encoding=0, text=['1'])])
+    fi = extract_tags.FileInfo(str(path))
+    assert (fi['f_artist'], fi['f_album'], fi['f_track'], fi['f_title']) == ('Artist', 'Album', '01', 'Song')
+    assert (fi['t_artist'], fi['t_album'], fi['t_track'], fi['t_title']) == ('Artist', 'Album', '1', '')
+
+def test_get_file_info_broken_link(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(extract_tags.tag_cache_usage, '_cache', extract_tags.tag_cache.TagCache('v1', ':memory:'))
+    path = tmp_path / '01 - Song.mp3'
+    path.symlink_to(tmp_path / 'missing.mp3')
+    fi = extract_tags.get_file_info(str(path))
+    assert fi.read_error
+    assert 'Error reading' in capsys.readouterr().out
+    assert len(extract_tags.get_tag_cache()) == 0
+
+def write_flac(path, comments, picture_size=0):
+    # Minimal FLAC stream: marker and STREAMINFO (44.1 kHz, stereo, 16 bit)
+    streaminfo = bytes(10) + ((44100 << 44) | (1 << 41) | (15 << 36)).to_bytes(8, 'big') + bytes(16)
+    path.write_bytes(b'fLaC' + bytes([0x80]) + (34).to_bytes(3, 'big') + streaminfo)
+    flac = FLAC(path)
+    if picture_size:
+        pic = Picture()
+        pic.data = b'\x00' * picture_size
+        flac.add_picture(pic)
+    for key, value in comments:
+        flac[key] = value
+    flac.save()
+
+def assert_flac_same_as_mutagen(path):
+    fast = extract_tags.read_flac_comments(path)
+    assert fast is not None
+    tags = FLAC(path).tags
+    assert {k : tags[k] for k in {k.lower() for k, _ in tags}} == fast
+
+def test_read_flac_comments(tmp_path):
+    path = tmp_path / '01 - Song.flac'
+    write_flac(path, [('ARTIST', 'Müller ☺'), ('title', ['Title', 'Alt']), ('TrackNumber', '3'), ('genre', '')],
+        picture_size=1000000)
+    assert_flac_same_as_mutagen(path)
+    assert extract_tags.read_flac_comments(path)['tracknumber'] == ['3']
+
+    # No Vorbis comment block at all
+    write_flac(path, [])
+    assert extract_tags.read_flac_comments(path) == {}
+
+def test_read_flac_comments_fallback(tmp_path):
+    path = tmp_path / '01 - Song.flac'
+    write_flac(path, [('artist', 'Artist')])
+
+    # ID3 tag in front of the FLAC stream
+    path.write_bytes(b'ID3\x04\x00\x00\x00\x00\x00\x00' + path.read_bytes())
+    assert extract_tags.read_flac_comments(path) is None
+
+    # Truncated file
+    write_flac(path, [('artist', 'Artist')])
+    path.write_bytes(path.read_bytes()[:50])
+    assert extract_tags.read_flac_comments(path) is None
+
+def test_file_info_flac(tmp_path):
+    path = tmp_path / 'Artist' / 'Album' / '02 - Song.flac'
+    path.parent.mkdir(parents=True)
+    write_flac(path, [('ARTIST', 'Artist'), ('album', 'Album'), ('tracknumber', '2'), ('date', ['2001', '2002'])])
+    fi = extract_tags.FileInfo(str(path))
+    assert (fi['f_type'], fi['f_track'], fi['f_title']) == ('flac', '02', 'Song')
+    assert (fi['t_artist'], fi['t_album'], fi['t_track'], fi['t_date'], fi['t_title']) == ('Artist', 'Album', '2', '2001', '')
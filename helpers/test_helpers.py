@@ -1,12 +1,63 @@
 #!/bin/python3
 
+import os
+import io
+import contextlib
+from unittest import mock
+import hashlib
+import chardet
 from pyfakefs.fake_filesystem_unittest import TestCase
 import helpers 
 from helpers import split_hash_filename, check_ext 
 
+def test_detect_encoding():
+    assert helpers.detect_encoding(b'abc') == 'utf-8'
+    # Sample ending within a multi-byte character
+    assert helpers.detect_encoding('abcü'.encode('utf-8')[:-1]) == 'utf-8'
+    assert helpers.detect_encoding('Müller.txt\r\nSchön.txt\r\n'.encode('latin-1')) != 'utf-8'
+
+def test_md5_index(tmp_path):
+    # mmap doesn't work on the fake file system, use a real temporary folder
+    lines = [
+        "dcc531fa14431e19749889e66f8c9560  dir/fileX.txt",
+        "acbe84a180cd7fb20b097d008fdedacb  dir/Müller.txt",
+        "dcc531fa14431e19749889e66f8c9560  fileX.txt",
+    ]
+    table = helpers.ChecksumTable()
+    table.add_columns(helpers.parse_hash_lines(lines))
+    index_file = tmp_path / 'list.md5idx'
+    helpers.md5_index.write_index(table, index_file)
+
+    with helpers.open_checksums(index_file) as index:
+        assert len(index) == 3
+        assert [index.hash(i) for i in range(3)] == [
+            "acbe84a180cd7fb20b097d008fdedacb", "dcc531fa14431e19749889e66f8c9560", "dcc531fa14431e19749889e66f8c9560"]
+        assert index.lookup("dcc531fa14431e19749889e66f8c9560") == ["dir/fileX.txt", "fileX.txt"]
+        assert index.lookup("acbe84a180cd7fb20b097d008fdedacb") == ["dir/Müller.txt"]
+        assert index.lookup("9424c8c2c0e2234a3d9dc9d4c4a09527") == []
+        assert [(d.hex(), pos) for d, pos in index.iter_groups(index.sorted_indices())] == [
+            ("acbe84a180cd7fb20b097d008fdedacb", (0, 1)), ("dcc531fa14431e19749889e66f8c9560", (1, 3))]
+
+def test_unicode_issues():
+    assert helpers.unicode_issues('Cafe') == []
+    assert helpers.unicode_issues('Café') == []
+    assert helpers.unicode_issues('SÃO PAULO') == []
+    assert helpers.unicode_issues('Cafe\u0301') == ['cdm', 'not_nfc']
+    assert helpers.unicode_issues('CafÃ©') == ['mojibake']
+    assert helpers.unicode_issues('GrÃ¶ÃŸe') == ['mojibake']
+    assert helpers.unicode_issues('Caf\udce9') == ['undecodable']
+    assert helpers.unicode_issues('\u212b') == ['not_nfc']
+
+    # Mark and the character before it, as reported by mp3_hier_checker_v5
+    assert helpers.find_cdm('Cafe\u0301 x') == 'e\u0301'
+    assert helpers.find_cdm('\u0301x') == '\u0301'
+    assert helpers.find_cdm('Café') is None
+
 class HelpersTest(TestCase):
     def setUp(self):
         self.setUpPyfakefs()
+        # The hash cache lives on the real file system, keep it out of the fake one
+        self.enterContext(mock.patch.object(helpers.hash_cache_usage, 'mode', 'off'))
 
     def test_split_hash_filename(self):
         # Test format by md5summer with leading asterisk
@@ -39,6 +90,55 @@ class HelpersTest(TestCase):
         self.assertEqual(v['hash'], "9424c8c2c0e2234a3d9dc9d4c4a09527")
         self.assertEqual(v['file'], "DSC06994.JPG")
 
+    def test_parse_hash_lines(self):
+        lines = [
+            "acbe84a180cd7fb20b097d008fdedacb *test_dir/dir2/test.txt",
+            "dcc531fa14431e19749889e66f8c9560 *fileX.txt",
+            "dcc531fa14431e19749889e66f8c9560  *fileX.txt",
+            "no hash in this line",
+            "9424c8c2c0e2234a3d9dc9d4c4a09527 ./DSC06994.JPG",
+            "9424c8c2c0e2234a3d9dc9d4c4a09527  ./DSC06994.JPG",
+            "9424c8c2c0e2234a3d9dc9d4c4a09527  DSC06994.JPG",
+        ]
+        exp = [split_hash_filename(l) for l in lines if split_hash_filename(l)]
+
+        # Line stream and single buffer (with CRLF) must give the same result
+        for data in [lines, '\r\n'.join(lines) + '\r\n']:
+            cols = helpers.parse_hash_lines(data)
+            self.assertEqual(len(cols), 6)
+            self.assertEqual(len(cols.digests), 6 * 16)
+            self.assertEqual([cols.hash(i) for i in range(len(cols))], [e['hash'] for e in exp])
+            self.assertEqual(cols.ws, [e['ws'] for e in exp])
+            self.assertEqual(cols.files, [e['file'] for e in exp])
+            self.assertEqual(list(cols.iter_digests())[0], bytes.fromhex('acbe84a180cd7fb20b097d008fdedacb'))
+
+    def test_checksum_table(self):
+        lines = [
+            "dcc531fa14431e19749889e66f8c9560 *C:\\dir\\fileX.txt",
+            "acbe84a180cd7fb20b097d008fdedacb *test_dir/dir2/test.txt",
+            "dcc531fa14431e19749889e66f8c9560  test_dir/dir2/fileX.txt",
+            "9424c8c2c0e2234a3d9dc9d4c4a09527  DSC06994.JPG",
+            "dcc531fa14431e19749889e66f8c9560  test_dir/dir2/\u00e4\udce9.txt",
+        ]
+        table = helpers.ChecksumTable()
+        table.add_columns(helpers.parse_hash_lines(lines[:2]))
+        table.add_columns(helpers.parse_hash_lines([]))
+        table.add_columns(helpers.parse_hash_lines(lines[2:]))
+        self.assertEqual(len(table), 5)
+        self.assertEqual([table.hash(i) for i in range(5)], [l[:32] for l in lines])
+        self.assertEqual([table.file(i) for i in range(5)], [split_hash_filename(l)['file'] for l in lines])
+        self.assertEqual(table.dirs, ['C:\\dir\\', 'test_dir/dir2/', ''])
+
+        # Sorted by digest, same digests keep their order
+        order = table.sorted_indices()
+        self.assertEqual(list(order), [3, 1, 0, 2, 4])
+        groups = list(table.iter_groups(order))
+        self.assertEqual([(d.hex(), pos) for d, pos in groups], [
+            ("9424c8c2c0e2234a3d9dc9d4c4a09527", (0, 1)),
+            ("acbe84a180cd7fb20b097d008fdedacb", (1, 2)),
+            ("dcc531fa14431e19749889e66f8c9560", (2, 5)),
+        ])
+
     def test_check_ext(self):
         # Without any filters, match always
         self.assertEqual(check_ext('test_file'), True)
@@ -206,5 +306,163 @@ class HelpersTest(TestCase):
         ]
         self.assertEqual(fl, exp_list)
 
+    def test_file_md5(self):
+        # Reference values calculated with md5sum
+        self.fs.create_file('./empty.txt')
+        self.fs.create_file('./hello.txt', contents='hello\n')
+        self.assertEqual(helpers.file_md5('./empty.txt'), 'd41d8cd98f00b204e9800998ecf8427e')
+        self.assertEqual(helpers.file_md5('./hello.txt'), 'b1946ac92492d2347c6235b4d2611184')
+
+        # File larger than the read buffer
+        self.fs.create_file('./big.bin', contents=b'a' * (helpers.HASH_CHUNK_SIZE + 1))
+        self.assertEqual(helpers.file_md5('./big.bin'), hashlib.md5(b'a' * (helpers.HASH_CHUNK_SIZE + 1)).hexdigest())
+
+    def test_hash_many(self):
+        self.fs.create_file('./empty.txt')
+        self.fs.create_file('./hello.txt', contents='hello\n')
+        files = ['./hello.txt', './empty.txt', './missing.txt']
+
+        res = dict(helpers.hash_many(files, jobs=2))
+        self.assertEqual(res, {
+            './hello.txt'   : 'b1946ac92492d2347c6235b4d2611184',
+            './empty.txt'   : 'd41d8cd98f00b204e9800998ecf8427e',
+            './missing.txt' : None})
+
+        res = [p for p, _ in helpers.hash_many(files, jobs=2, ordered=True)]
+        self.assertEqual(res, files)
+
+    def test_hash_cache(self):
+        from hash_cache import HashCache
+
+        self.fs.create_file('./hello.txt', contents='hello\n')
+        self.fs.create_file('./world.txt', contents='world\n')
+        cache = HashCache(':memory:', max_entries=1)
+
+        st = os.stat('./hello.txt')
+        self.assertEqual(cache.get(st, 'md5'), None)
+        cache.put('./hello.txt', st, 'md5', 'b1946ac92492d2347c6235b4d2611184')
+        self.assertEqual(cache.get(st, 'md5'), 'b1946ac92492d2347c6235b4d2611184')
+        self.assertEqual(cache.get(st, 'sha256'), None)
+
+        # Modified file must not match
+        os.utime('./hello.txt', ns=(st.st_atime_ns, st.st_mtime_ns + 1))
+        self.assertEqual(cache.get(os.stat('./hello.txt'), 'md5'), None)
+
+        # Least recently used entry is evicted
+        cache.put('./world.txt', os.stat('./world.txt'), 'md5', '591785b794601e212b260e25925636fd')
+        cache._now += 1
+        self.assertEqual(cache.get(os.stat('./world.txt'), 'md5'), '591785b794601e212b260e25925636fd')
+        cache.evict()
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.get(st, 'md5'), None)
+        cache.close()
+
+    def test_tag_cache(self):
+        from tag_cache import TagCache
+
+        self.fs.create_file('./a.mp3')
+        st = os.stat('./a.mp3')
+        fields = {'t_artist' : 'Müller', 't_track' : '1', 'f_title' : 'x\udce9'}
+        cache = TagCache('v1', ':memory:')
+
+        self.assertEqual(cache.get('/lib/a.mp3', st.st_size, st.st_mtime_ns), None)
+        cache.put('/lib/a.mp3', st.st_size, st.st_mtime_ns, fields)
+        self.assertEqual(cache.get('/lib/a.mp3', st.st_size, st.st_mtime_ns), fields)
+
+        # Modified file must not match
+        self.assertEqual(cache.get('/lib/a.mp3', st.st_size, st.st_mtime_ns + 1), None)
+        self.assertEqual(len(cache), 1)
+        cache.close()
+
+    def test_cache_usage(self):
+        from sqlite_cache import CacheUsage
+        from tag_cache import TagCache
+
+        usage = CacheUsage('Tag cache', lambda: TagCache('v1', ':memory:'))
+        cache = usage.get()
+        self.assertIs(usage.get(), cache)
+        usage.close()
+        usage.mode = 'off'
+        self.assertEqual(usage.get(), None)
+
+        # A cache which can't be opened is disabled
+        def fail():
+            raise OSError('read-only file system')
+        usage = CacheUsage('Tag cache', fail)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(usage.get(), None)
+        self.assertEqual(usage.mode, 'off')
+
+    def test_tag_catalog(self):
+        from tag_catalog import TagCatalog
+
+        columns = ['f_artist', 'f_title', 't_artist', 't_album', 't_track']
+        catalog = TagCatalog(':memory:', columns)
+        catalog.add([
+            ('/lib/B/x/02 - b.mp3', {'f_artist' : 'B', 'f_title' : 'b', 't_artist' : 'B', 't_album' : 'x', 't_track' : '2'}),
+            ('/lib/B/x/01 - a.mp3', {'f_artist' : 'B', 'f_title' : 'a\udce9', 't_artist' : 'B', 't_album' : 'x', 't_track' : '1'}),
+            ('/lib/A/y/01 - c.mp3', {'f_artist' : 'A', 'f_title' : 'c', 't_artist' : 'Müller', 't_album' : 'y', 't_track' : '1'}),
+        ])
+        self.assertEqual(len(catalog), 3)
+        self.assertEqual([f for f, _ in catalog.find(t_artist='B')], ['/lib/B/x/01 - a.mp3', '/lib/B/x/02 - b.mp3'])
+        self.assertEqual(catalog.find(t_artist='Müller', t_track='1')[0][1]['f_artist'], 'A')
+        self.assertEqual(catalog.find(f_title='a\udce9')[0][0], '/lib/B/x/01 - a.mp3')
+        self.assertEqual(catalog.find(t_album='z'), [])
+        with self.assertRaises(ValueError):
+            catalog.find(t_genre='Rock')
+
+        # Same file replaces the previous entry
+        catalog.add([('/lib/A/y/01 - c.mp3', {'f_artist' : 'A', 'f_title' : 'c', 't_artist' : 'A', 't_album' : 'y', 't_track' : '1'})])
+        self.assertEqual(len(catalog), 3)
+        self.assertEqual(catalog.find(t_artist='Müller'), [])
+        self.assertEqual(len(catalog.file_names()), 3)
+        catalog.clear()
+        self.assertEqual(len(catalog), 0)
+
+        # Missing columns are stored empty, extra fields ignored
+        catalog.add([('/lib/C/z/01 - d.mp3', {'t_artist' : 'C', 't_genre' : 'Rock'})])
+        self.assertEqual(catalog.find(t_artist='C')[0][1], {'f_artist' : '', 'f_title' : '', 't_artist' : 'C', 't_album' : '', 't_track' : ''})
+        catalog.close()
+
+        # Opening a missing catalog for lookups doesn't create it
+        with self.assertRaises(FileNotFoundError):
+            TagCatalog('/missing.sqlite')
+        self.assertFalse(os.path.exists('/missing.sqlite'))
+
+    def test_file_digests(self):
+        self.fs.create_file('./hello.txt', contents='hello\n')
+        res = helpers.file_digests('./hello.txt', ['md5', 'sha256', 'blake2b', 'crc32'])
+        self.assertEqual(res['md5'], 'b1946ac92492d2347c6235b4d2611184')
+        self.assertEqual(res['sha256'], '5891b5b522d5df086d0ff0b110fbd9d21bb4fc7163af34d08286a2e846f6be03')
+        self.assertEqual(res['blake2b'], hashlib.blake2b(b'hello\n').hexdigest())
+        self.assertEqual(res['crc32'], '363a3020')
+        self.assertEqual(helpers.file_digest('./hello.txt', 'sha256'), res['sha256'])
+
+    def test_file_head_tail_md5(self):
+        self.fs.create_file('./a.bin', contents=b'a' * 10 + b'b' * 10 + b'c' * 10)
+        self.fs.create_file('./b.bin', contents=b'a' * 10 + b'x' * 10 + b'c' * 10)
+        self.fs.create_file('./c.bin', contents=b'a' * 10 + b'b' * 10 + b'x' * 10)
+
+        # Differences in the middle are not detected, at head or tail they are
+        self.assertEqual(helpers.file_head_tail_md5('./a.bin', 10), helpers.file_head_tail_md5('./b.bin', 10))
+        self.assertNotEqual(helpers.file_head_tail_md5('./a.bin', 10), helpers.file_head_tail_md5('./c.bin', 10))
+
+        # Small files are hashed completely
+        self.assertEqual(helpers.file_head_tail_md5('./a.bin', 100), helpers.file_md5('./a.bin'))
+
+    def test_iter_hash_records(self):
+        # chardet loads its models from the real file system
+        self.fs.add_real_directory(os.path.dirname(chardet.__file__))
+
+        # md5sum on UNIX, UTF-8
+        self.fs.create_file('./utf8.md5', contents='acbe84a180cd7fb20b097d008fdedacb  ./Müller.txt\n# comment\n9424c8c2c0e2234a3d9dc9d4c4a09527  ./b.txt\n'.encode('utf-8'))
+        # MD5Summer on Windows, Latin-1 and CRLF
+        self.fs.create_file('./latin1.md5', contents='acbe84a180cd7fb20b097d008fdedacb *Müller.txt\r\n9424c8c2c0e2234a3d9dc9d4c4a09527 *b.txt\r\n'.encode('latin-1'))
+
+        self.assertEqual(list(helpers.iter_lines('./utf8.md5'))[1], '# comment')
 
+        res = [(v['hash'], v['file']) for v in helpers.iter_hash_records('./utf8.md5')]
+        self.assertEqual(res, [('acbe84a180cd7fb20b097d008fdedacb', './Müller.txt'), ('9424c8c2c0e2234a3d9dc9d4c4a09527', './b.txt')])
 
+        res = [(v['hash'], v['file']) for v in helpers.iter_hash_records('./latin1.md5')]
+        self.assertEqual(res, [('acbe84a180cd7fb20b097d008fdedacb', 'Müller.txt'), ('9424c8c2c0e2234a3d9dc9d4c4a09527', 'b.txt')])
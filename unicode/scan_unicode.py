@@ -0,0 +1,115 @@
+#!/usr/bin/python3
+
+# Scan file and folder names and the tags of all MP3 and FLAC files below a folder for
+# Unicode problems: combining diacritical marks, strings not in NFC, mojibake (UTF-8
+# decoded as Latin-1, e.g. 'Ã©') and names which are not valid UTF-8.
+#
+# Files are scanned in chunks by several processes. Every problem found is printed,
+# followed by a summary per field (name of the file or folder, and tags). Only the last
+# component of each path is checked, so a bad folder name is reported once, not for
+# every file below. The exit code is 1 if any problem was found.
+
+import sys
+import os
+import argparse
+import collections
+import concurrent.futures
+import pathlib
+
+# custom modules
+mod_path = pathlib.Path(__file__).resolve().parents[1]/'helpers'
+sys.path.insert(0, str(mod_path))
+import helpers, extract_tags
+
+### Number of files scanned by a worker process at once
+CHUNK_SIZE = 256
+
+TAG_FIELDS = list(extract_tags.FileInfo.t_tags)
+
+def collect_paths(top_dir):
+	'''Return sorted list of all files and folders below top_dir, relative to top_dir.'''
+	paths = []
+	for dirpath, dirnames, filenames in os.walk(top_dir):
+		rel_dir = os.path.relpath(dirpath, top_dir)
+		for name in dirnames + filenames:
+			paths.append(os.path.normpath(os.path.join(rel_dir, name)))
+	return sorted(paths)
+
+def is_tagged(path):
+	return os.path.splitext(path)[1].lower() in ('.mp3', '.flac')
+
+def printable(path):
+	'''Return path with bytes which are not valid UTF-8 replaced, so it can be printed.'''
+	return path.encode('utf-8', errors='surrogateescape').decode('utf-8', errors='replace')
+
+def scan_values(values):
+	'''Return tuple (Counter of fields scanned, list of (path, field, issues, value) found)
+	for values, a list of (path, field, value).'''
+	counts = collections.Counter()
+	found = []
+	for path, field, value in values:
+		counts[field] += 1
+		issues = helpers.unicode_issues(value)
+		if issues:
+			found.append((path, field, issues, value))
+	return counts, found
+
+def scan_chunk(top_dir, chunk):
+	'''Scan the paths in chunk, a list of (path, FileInfo or None). Tags of files without
+	FileInfo are read. Return tuple (counts, found, list of (st, FileInfo) read).'''
+	values = []
+	read = []
+	for path, fi in chunk:
+		values.append((path, 'name', os.path.basename(path)))
+		if not is_tagged(path):
+			continue
+		if fi is None:
+			st, fi = extract_tags.read_file_info(os.path.join(top_dir, path))
+			read.append((st, fi))
+		values.extend((path, field, fi[field]) for field in TAG_FIELDS)
+	counts, found = scan_values(values)
+	return counts, found, read
+
+def scan_library(top_dir, jobs=None, chunk_size=CHUNK_SIZE, quiet=False):
+	'''Scan all paths and tags below top_dir, print problems and summary.
+	Return Counter of problems per (field, issue).'''
+	paths = collect_paths(top_dir)
+
+	# The tag cache is looked up here, only files not found are read by the workers
+	items = [(path, extract_tags.lookup_file_info(os.path.join(top_dir, path)) if is_tagged(path) else None) for path in paths]
+	chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+	counts = collections.Counter()
+	issues = collections.Counter()
+	with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+		for chunk_counts, found, read in executor.map(scan_chunk, [top_dir] * len(chunks), chunks):
+			counts.update(chunk_counts)
+			for st, fi in read:
+				extract_tags.store_file_info(st, fi)
+			for path, field, value_issues, value in found:
+				issues.update((field, issue) for issue in value_issues)
+				if not quiet:
+					print('{}: {} in {}: {}'.format(', '.join(value_issues), field, printable(path), ascii(value)))
+
+	print('{:16} {:>9}'.format('field', 'values') + ''.join(' {:>11}'.format(issue) for issue in helpers.UNICODE_ISSUES))
+	for field in ['name'] + TAG_FIELDS:
+		print('{:16} {:9}'.format(field, counts[field]) + ''.join(' {:11}'.format(issues[field, issue]) for issue in helpers.UNICODE_ISSUES))
+	return issues
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser()
+	parser.add_argument('top_dir', help='Folder to scan, e.g. the root of the music library.')
+	parser.add_argument('--jobs', type=int, default=None, metavar='N', help='Number of parallel processes.')
+	parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, metavar='N', help='Number of files scanned by a process at once (default: %(default)s).')
+	parser.add_argument('--quiet', action='store_true', help='Only print the summary.')
+	extract_tags.add_tag_cache_args(parser)
+	args = parser.parse_args()
+	extract_tags.set_tag_cache_args(args)
+
+	if not os.path.isdir(args.top_dir):
+		print('Argument must be a folder.')
+		sys.exit(1)
+
+	issues = scan_library(args.top_dir, jobs=args.jobs, chunk_size=args.chunk_size, quiet=args.quiet)
+	if issues:
+		sys.exit(1)
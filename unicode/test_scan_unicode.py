@@ -0,0 +1,20 @@
+#!/usr/bin/python3
+
+import collections
+from mutagen.id3 import TPE1, TIT2
+import scan_unicode
+from mp3_fixtures import write_mp3
+
+def test_scan_library(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(scan_unicode.extract_tags.tag_cache_usage, 'mode', 'off')
+    album = tmp_path / 'CafÃ©' / 'Album'
+    for track, artist in enumerate(['Artist', 'Cafe\u0301', 'Artist'], start=1):
+        write_mp3(album / f'{track:02} - Song.mp3', [TPE1(encoding=3, text=[artist]), TIT2(encoding=3, text=['Song'])])
+    (album / 'Ã¼.txt').write_bytes(b'')
+
+    issues = scan_unicode.scan_library(str(tmp_path), jobs=1)
+    # The bad artist folder is reported once, not for every entry below it
+    assert issues == collections.Counter({('name', 'mojibake') : 2, ('t_artist', 'cdm') : 1, ('t_artist', 'not_nfc') : 1})
+    out = capsys.readouterr().out
+    assert "mojibake: name in CafÃ©/Album/Ã¼.txt: '\\xc3\\xbc.txt'" in out
+    assert 'name                     6' in out